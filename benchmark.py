@@ -0,0 +1,216 @@
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import importlib.util
+import multiprocessing
+import http.server
+import socketserver
+from pathlib import Path
+
+# 默认测试最新版本的下载管理器
+DEFAULT_SCRIPT = Path(__file__).parent / "download3.4.4.py"
+
+
+def load_download_module(script_path):
+    """按文件路径加载下载管理器脚本（文件名带版本号，无法直接 import）"""
+    spec = importlib.util.spec_from_file_location("download_manager", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    """支持 Range 请求和 keep-alive 的本地测试服务器，响应内容为固定的伪随机数据"""
+    protocol_version = 'HTTP/1.1'
+    data = b''
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body_headers(self, status, start, end):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"benchmark"')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(self.data)}')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_body_headers(200, 0, len(self.data) - 1)
+
+    def do_GET(self):
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(self.data) - 1), len(self.data) - 1)
+            self.send_body_headers(206, start, end)
+        else:
+            start, end = 0, len(self.data) - 1
+            self.send_body_headers(200, start, end)
+
+        view = memoryview(self.data)[start:end + 1]
+        try:
+            for offset in range(0, len(view), 256 * 1024):
+                self.wfile.write(view[offset:offset + 256 * 1024])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+def run_server(port_queue, size):
+    """在独立进程中运行测试服务器，避免其线程计入客户端统计"""
+    RangeRequestHandler.data = os.urandom(1024 * 1024) * (size // (1024 * 1024))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def run_download(module, url, engine, connections, download_dir):
+    """用指定引擎下载一次，返回 (耗时, 字节数, 峰值线程数)"""
+    manager = module.DownloadManager(gui_callback=lambda event, data: True if event == "file_exists" else None)
+    manager.url = url
+    manager.download_path = str(download_dir)
+    manager.use_multithread = True
+    manager.thread_count = connections
+    manager.engine = engine
+
+    peak_threads = threading.active_count()
+    worker = threading.Thread(target=manager.download_file, daemon=True)
+    start = time.perf_counter()
+    worker.start()
+    while worker.is_alive():
+        peak_threads = max(peak_threads, threading.active_count())
+        worker.join(0.05)
+    elapsed = time.perf_counter() - start
+    return elapsed, manager.download_progress["downloaded"], peak_threads
+
+
+def benchmark_engines(args):
+    """对比线程池引擎与asyncio引擎"""
+    module = load_download_module(args.script)
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_server, args=(port_queue, args.size * 1024 * 1024), daemon=True)
+    server.start()
+    url = f"http://127.0.0.1:{port_queue.get()}/benchmark.bin"
+
+    print(f"文件大小: {args.size} MB, 每组重复 {args.repeat} 次")
+    print(f"{'引擎':<10}{'连接数':>8}{'耗时(秒)':>12}{'吞吐(MB/s)':>14}{'峰值线程':>10}")
+    try:
+        for connections in args.connections:
+            for engine in ("thread", "asyncio"):
+                results = []
+                for _ in range(args.repeat):
+                    download_dir = Path(tempfile.mkdtemp(prefix="dm_bench_"))
+                    try:
+                        results.append(run_download(module, url, engine, connections, download_dir))
+                    finally:
+                        shutil.rmtree(download_dir, ignore_errors=True)
+                elapsed = min(result[0] for result in results)
+                downloaded = results[0][1]
+                peak = max(result[2] for result in results)
+                print(f"{engine:<10}{connections:>8}{elapsed:>12.2f}"
+                      f"{downloaded / elapsed / 1024 / 1024:>14.1f}{peak:>10}")
+    finally:
+        server.terminate()
+
+
+def legacy_merge(file_path, temp_files):
+    """旧版合并方式：逐个分块以 8KB 为单位读写"""
+    with open(file_path, 'wb') as outfile:
+        for temp_file in temp_files:
+            with open(temp_file, 'rb') as infile:
+                while True:
+                    chunk = infile.read(8192)
+                    if not chunk:
+                        break
+                    outfile.write(chunk)
+
+
+def create_parts(part_dir, size, parts):
+    """生成测试用的分块文件，返回 [(路径, 目标偏移)]"""
+    block = os.urandom(4 * 1024 * 1024)
+    part_size = size // parts
+    result = []
+    for index in range(parts):
+        length = part_size if index < parts - 1 else size - part_size * (parts - 1)
+        path = part_dir / f"bench.part{index}"
+        with open(path, 'wb') as f:
+            written = 0
+            while written < length:
+                f.write(block[:min(len(block), length - written)])
+                written += min(len(block), length - written)
+        result.append((path, index * part_size))
+    return result
+
+
+def benchmark_merge(args):
+    """对比旧版 8KB 读写合并与并行零拷贝合并的吞吐量"""
+    module = load_download_module(args.script)
+    size = args.size * 1024 * 1024
+    work_dir = Path(tempfile.mkdtemp(prefix="dm_merge_", dir=args.dir))
+    print(f"文件大小: {args.size} MB, 分块数: {args.parts}, 目录: {work_dir}")
+    try:
+        # 旧版合并
+        parts = create_parts(work_dir, size, args.parts)
+        if hasattr(os, 'sync'):
+            os.sync()  # 排除脏页回写对计时的影响
+        start = time.perf_counter()
+        legacy_merge(work_dir / "legacy.bin", [path for path, _ in parts])
+        legacy_time = time.perf_counter() - start
+        (work_dir / "legacy.bin").unlink()
+        print(f"{'8KB读写合并':<20}{legacy_time:>8.2f} 秒{size / legacy_time / 1024 ** 3:>10.2f} GB/s")
+
+        # 新版并行零拷贝合并（合并后分块文件会被删除）
+        manager = module.DownloadManager()
+        manager.merge_workers = args.workers
+        if hasattr(os, 'sync'):
+            os.sync()  # 排除脏页回写对计时的影响
+        start = time.perf_counter()
+        methods = manager.merge_parts(work_dir / "merged.bin", size, parts)
+        merge_time = time.perf_counter() - start
+        print(f"{'并行零拷贝合并':<20}{merge_time:>8.2f} 秒{size / merge_time / 1024 ** 3:>10.2f} GB/s"
+              f"  ({', '.join(sorted(set(methods)))})")
+        print(f"加速比: {legacy_time / merge_time:.1f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="下载管理器性能基准测试")
+    parser.add_argument("--script", default=str(DEFAULT_SCRIPT), help="被测试的下载管理器脚本")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    engines = subparsers.add_parser("engines", help="对比线程池与asyncio下载引擎")
+    engines.add_argument("--size", type=int, default=256, help="测试文件大小(MB)")
+    engines.add_argument("--connections", type=int, nargs="+", default=[8, 32, 128], help="连接数")
+    engines.add_argument("--repeat", type=int, default=3, help="每组重复次数")
+    engines.set_defaults(func=benchmark_engines)
+
+    merge = subparsers.add_parser("merge", help="对比分块文件的合并速度")
+    merge.add_argument("--size", type=int, default=4096, help="合并后文件大小(MB)")
+    merge.add_argument("--parts", type=int, default=16, help="分块文件数")
+    merge.add_argument("--workers", type=int, default=4, help="并行合并线程数")
+    merge.add_argument("--dir", default=None, help="测试目录（应与下载目录位于同一文件系统）")
+    merge.set_defaults(func=benchmark_merge)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
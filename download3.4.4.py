@@ -1,30 +1,1238 @@
 import os
+import re
 import time
 import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.poolmanager import PoolManager
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
 import random
 import string
 import math
-from urllib.parse import urlparse
+import calendar
+import asyncio
+import ssl
+import socket
+import ipaddress
+from urllib.parse import urlparse, urljoin, parse_qsl
 from pathlib import Path
 import shutil
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import sys
 import concurrent.futures
-import queue
+import collections
+import weakref
+import statistics
+import json
 import traceback
 
+try:
+    import dns.resolver  # 可选依赖 dnspython：按记录自身的 TTL 缓存解析结果
+except ImportError:
+    dns = None
+
+
+class DNSCache:
+    """按 TTL 缓存域名的全部 A/AAAA 地址，新连接在健康地址间轮转，连接失败的地址降级一段时间"""
+
+    def __init__(self, default_ttl=60, demote_time=30):
+        self.lock = threading.Lock()
+        self.default_ttl = default_ttl  # 系统解析器无法提供 TTL 时使用
+        self.demote_time = demote_time
+        self.entries = {}  # 主机 -> (过期时间, [地址])
+        self.next_index = collections.Counter()  # 各主机下一个轮转位置
+        self.demoted = {}  # (主机, 地址) -> 降级结束时间
+        self.connections = collections.Counter()  # (主机, 地址) -> 新建连接数
+        self.failures = collections.Counter()  # (主机, 地址) -> 连接失败次数
+
+    @staticmethod
+    def is_ip(host):
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    def lookup(self, host, port):
+        """解析全部 A/AAAA 地址，返回 (地址列表, TTL)；地址以系统解析器为准（遵循 hosts 文件等本机配置）"""
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        return addresses, self.record_ttl(host, addresses)
+
+    def record_ttl(self, host, addresses):
+        """安装 dnspython 时查询 DNS 记录自身的 TTL；记录与系统解析结果不符（如被 hosts 文件覆盖）时使用默认 TTL"""
+        ttl = self.default_ttl
+        if dns is None:
+            return ttl
+        for record_type in ('A', 'AAAA'):
+            try:
+                answer = dns.resolver.resolve(host, record_type)
+            except dns.exception.DNSException:
+                continue
+            if any(record.to_text() in addresses for record in answer):
+                ttl = min(ttl, answer.rrset.ttl)
+        return ttl
+
+    def resolve(self, host, port):
+        """返回主机的全部地址（缓存过期时重新解析，解析失败时沿用过期的结果）"""
+        with self.lock:
+            entry = self.entries.get(host)
+        if entry and entry[0] > time.time():
+            return entry[1]
+        try:
+            addresses, ttl = self.lookup(host, port)
+        except OSError:
+            if entry:
+                return entry[1]
+            raise
+        with self.lock:
+            self.entries[host] = (time.time() + max(1, ttl), addresses)
+        return addresses
+
+    def pick(self, host, port):
+        """为新连接选择地址：在未降级的地址间轮转，全部被降级时使用最早恢复的地址；解析失败时返回主机名"""
+        if self.is_ip(host):
+            return host
+        try:
+            addresses = self.resolve(host, port)
+        except OSError:
+            return host  # 交给连接本身解析并报告错误
+        now = time.time()
+        with self.lock:
+            healthy = [address for address in addresses if self.demoted.get((host, address), 0) <= now]
+            if not healthy:
+                healthy = [min(addresses, key=lambda address: self.demoted.get((host, address), 0))]
+            address = healthy[self.next_index[host] % len(healthy)]
+            self.next_index[host] += 1
+            self.connections[(host, address)] += 1
+            return address
+
+    def healthy_count(self, host):
+        """主机当前未降级的缓存地址数"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(host)
+            addresses = entry[1] if entry else []
+            return sum(1 for address in addresses if self.demoted.get((host, address), 0) <= now)
+
+    def demote(self, host, address):
+        """连接失败的地址在 demote_time 秒内不再分配新连接"""
+        if address == host:
+            return
+        with self.lock:
+            self.demoted[(host, address)] = time.time() + self.demote_time
+            self.failures[(host, address)] += 1
+
+    def stats(self):
+        """返回各主机各地址的 (新建连接数, 连接失败次数, 是否处于降级中)"""
+        now = time.time()
+        with self.lock:
+            result = collections.defaultdict(dict)
+            for host, address in set(self.connections) | set(self.failures):
+                result[host][address] = (self.connections[(host, address)], self.failures[(host, address)],
+                                         self.demoted.get((host, address), 0) > now)
+            return dict(result)
+
+
+class SourceAddressPool:
+    """本地源地址池：新连接按轮转或按实测吞吐量绑定到不同的本地地址（多出口），并统计各源地址的流量"""
+
+    def __init__(self, sources, mode="round_robin"):
+        self.lock = threading.Lock()
+        self.sources = list(sources)
+        self.addresses = [self.resolve_source(source) for source in self.sources]
+        self.mode = mode  # "round_robin"=轮转, "throughput"=按实测吞吐量加权
+        self.next_index = 0
+        self.connections = collections.Counter()  # 源地址 -> 新建连接数
+        self.bytes = collections.Counter()  # 源地址 -> 接收字节数
+        self.busy_time = collections.Counter()  # 源地址 -> 分段传输累计耗时
+
+    @staticmethod
+    def resolve_source(source):
+        """IP 地址原样使用；网卡名（Linux）解析为该网卡的 IPv4 地址"""
+        try:
+            ipaddress.ip_address(source)
+            return source
+        except ValueError:
+            pass
+        try:
+            import fcntl
+            import struct
+            SIOCGIFADDR = 0x8915
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                packed = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, struct.pack('256s', source.encode()[:15]))
+            return socket.inet_ntoa(packed[20:24])
+        except (ImportError, OSError) as e:
+            raise ValueError(f"无法识别的源地址或网卡: {source}") from e
+
+    def pick(self):
+        """为新连接选择源地址"""
+        with self.lock:
+            if self.mode == "throughput":
+                untested = [address for address in self.addresses if not self.connections[address]]
+                if untested:
+                    address = untested[0]
+                else:
+                    # 按各源地址的单连接实测速度加权随机选择，尚无数据的按最低权重参与
+                    weights = [self.bytes[address] / self.busy_time[address] if self.busy_time[address] else 0
+                               for address in self.addresses]
+                    floor = max(1.0, min((weight for weight in weights if weight), default=1.0) / 10)
+                    address = random.choices(self.addresses, [max(weight, floor) for weight in weights])[0]
+            else:
+                address = self.addresses[self.next_index % len(self.addresses)]
+                self.next_index += 1
+            self.connections[address] += 1
+            return address
+
+    def record(self, address, nbytes, elapsed):
+        """记录一次分段传输的字节数和耗时"""
+        if address not in self.addresses:
+            return
+        with self.lock:
+            self.bytes[address] += nbytes
+            self.busy_time[address] += elapsed
+
+    def stats(self):
+        """返回各源地址的新建连接数、接收字节数和单连接平均速度"""
+        with self.lock:
+            return {address: {"connections": self.connections[address], "bytes": self.bytes[address],
+                              "rate": self.bytes[address] / self.busy_time[address] if self.busy_time[address] else 0}
+                    for address in self.addresses}
+
+
+class ConnectionTrackingMixin:
+    """建立新连接（TCP/TLS握手）时通知观察者；有 DNS 缓存时连接到缓存分配的地址，有源地址池时绑定分配的本地地址"""
+
+    def __init__(self, *args, observer=None, dns_cache=None, source_pool=None, **kwargs):
+        self.observer = observer
+        self.dns_cache = dns_cache
+        self.source_pool = source_pool
+        super().__init__(*args, **kwargs)
+
+    def _new_conn(self):
+        if self.source_pool:
+            self.source_address = (self.source_pool.pick(), 0)
+        if self.dns_cache is None:
+            sock = super()._new_conn()
+        else:
+            # 仅在建立 TCP 连接期间把解析用的主机名换成分配的地址，TLS 的 SNI 和证书校验仍使用原主机名
+            host = self._dns_host
+            tried = set()
+            while True:
+                address = self.dns_cache.pick(host, self.port)
+                tried.add(address)
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except (NewConnectionError, ConnectTimeoutError):
+                    self.dns_cache.demote(host, address)
+                    if self.dns_cache.healthy_count(host) == 0 or len(tried) >= 3:
+                        raise
+                finally:
+                    self._dns_host = host
+        if self.observer:
+            self.observer.connection_opened(self)
+        return sock
+
+
+class TrackedHTTPConnection(ConnectionTrackingMixin, HTTPConnection):
+    pass
+
+
+class TrackedHTTPSConnection(ConnectionTrackingMixin, HTTPSConnection):
+    pass
+
+
+class TrackedPoolManager(PoolManager):
+    """为每个连接池换用可统计握手次数的连接类"""
+
+    def __init__(self, observer, *args, dns_cache=None, source_pool=None, **kwargs):
+        self.observer = observer
+        self.dns_cache = dns_cache
+        self.source_pool = source_pool
+        super().__init__(*args, **kwargs)
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context)
+        pool.ConnectionCls = TrackedHTTPSConnection if scheme == 'https' else TrackedHTTPConnection
+        pool.conn_kw['observer'] = self.observer
+        pool.conn_kw['dns_cache'] = self.dns_cache
+        pool.conn_kw['source_pool'] = self.source_pool
+        return pool
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """长连接复用的连接池适配器，统计新建连接数与请求数"""
+
+    def __init__(self, pool_size, dns_cache=None, source_pool=None):
+        self.stats_lock = threading.Lock()
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self.connections = weakref.WeakSet()  # 建立过的连接，停止时逐个中断
+        self.dns_cache = dns_cache
+        self.source_pool = source_pool
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = TrackedPoolManager(self, num_pools=connections, maxsize=maxsize,
+                                              block=block, dns_cache=self.dns_cache,
+                                              source_pool=self.source_pool, **pool_kwargs)
+
+    def connection_opened(self, connection):
+        with self.stats_lock:
+            self.connections_opened += 1
+            self.connections.add(connection)
+
+    def abort_connections(self):
+        """关闭所有连接的套接字读写，阻塞在其上的请求和读取立即出错返回（连接池之后会自动重连）"""
+        with self.stats_lock:
+            connections = list(self.connections)
+        for connection in connections:
+            sock = getattr(connection, 'sock', None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def send(self, request, **kwargs):
+        with self.stats_lock:
+            self.requests_sent += 1
+        return super().send(request, **kwargs)
+
+    def stats(self):
+        """返回连接复用统计"""
+        with self.stats_lock:
+            return {
+                "connections": self.connections_opened,
+                "requests": self.requests_sent,
+                "reused": max(0, self.requests_sent - self.connections_opened)
+            }
+
+
+class AsyncEngine:
+    """共享的asyncio事件循环，运行在单独的守护线程中，所有任务的协程连接都在此循环上调度"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def shared(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def submit(self, coro):
+        """把协程提交到事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+async def with_timeout(awaitable, timeout, message):
+    """带超时等待，超时抛出带说明的 TimeoutError（timeout 为 None 时不限时）"""
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(message) from None
+
+
+class AsyncResponse:
+    """asyncio HTTP响应，支持Content-Length、chunked和读到连接关闭三种响应体"""
+
+    def __init__(self, client, key, reader, writer):
+        self.client = client
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status = 0
+        self.headers = {}
+        self.remaining = None  # Content-Length 剩余字节数
+        self.chunked = False
+        self.chunk_left = 0
+        self.finished = False
+        self.keep_alive = True
+        self.loop = asyncio.get_running_loop()
+
+    async def read_head(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("连接已被服务器关闭")
+        parts = status_line.decode('latin-1').split(None, 2)
+        self.status = int(parts[1])
+        if parts[0] == 'HTTP/1.0':
+            self.keep_alive = False
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+
+        if self.headers.get('connection', '').lower() == 'close':
+            self.keep_alive = False
+        if 'chunked' in self.headers.get('transfer-encoding', '').lower():
+            self.chunked = True
+        elif 'content-length' in self.headers:
+            self.remaining = int(self.headers['content-length'])
+            self.finished = self.remaining == 0
+        else:
+            self.keep_alive = False  # 读到连接关闭为止
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise IOError(f"HTTP {self.status} 错误")
+
+    async def read(self, size):
+        """读取最多 size 字节响应体，读完返回 b''；超过读取超时没有数据时抛出 TimeoutError"""
+        if self.finished:
+            return b''
+        try:
+            return await with_timeout(self.read_body(size), self.client.timeouts[1], "读取响应体超时")
+        except TimeoutError:
+            self.keep_alive = False
+            raise
+
+    async def read_body(self, size):
+        if self.finished:
+            return b''
+        if self.chunked:
+            if self.chunk_left == 0:
+                size_line = await self.reader.readline()
+                self.chunk_left = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if self.chunk_left == 0:
+                    # 跳过 trailer
+                    while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    self.finished = True
+                    return b''
+            data = await self.reader.read(min(size, self.chunk_left))
+            if not data:
+                raise ConnectionResetError("chunked响应体不完整")
+            self.chunk_left -= len(data)
+            if self.chunk_left == 0:
+                await self.reader.readline()  # 块结尾的 CRLF
+            return data
+        if self.remaining is not None:
+            data = await self.reader.read(min(size, self.remaining))
+            if not data:
+                raise ConnectionResetError("响应体不完整")
+            self.remaining -= len(data)
+            self.finished = self.remaining == 0
+            return data
+        data = await self.reader.read(size)
+        if not data:
+            self.finished = True
+        return data
+
+    def local_address(self):
+        """返回连接的本地地址"""
+        sockname = self.writer.get_extra_info('sockname')
+        return sockname[0] if sockname else None
+
+    def abort(self):
+        """从任意线程中断连接，正在等待的读取会立即以连接关闭结束"""
+        self.keep_alive = False
+        self.loop.call_soon_threadsafe(self.writer.transport.abort)
+
+    def release(self):
+        """响应体读完且可复用时归还连接，否则关闭"""
+        if self.finished and self.keep_alive:
+            self.client.idle[self.key].append((self.reader, self.writer))
+        else:
+            self.writer.close()
+
+
+class AsyncHTTPClient:
+    """基于asyncio流的精简HTTP/1.1客户端，按主机复用keep-alive连接"""
+
+    def __init__(self, dns_cache=None, source_pool=None):
+        self.idle = collections.defaultdict(list)
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self.dns_cache = dns_cache
+        self.source_pool = source_pool
+        self.timeouts = (None, None)  # (连接超时, 读取超时)秒
+
+    async def connect(self, key):
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == 'https' else None
+        address = host
+        if self.dns_cache:
+            address = await asyncio.get_running_loop().run_in_executor(None, self.dns_cache.pick, host, port)
+        local_addr = (self.source_pool.pick(), 0) if self.source_pool else None
+        tried = {address}
+        while True:
+            try:
+                reader, writer = await with_timeout(
+                    asyncio.open_connection(address, port, ssl=context, server_hostname=host if context else None,
+                                            local_addr=local_addr, limit=1024 * 1024),
+                    self.timeouts[0], f"连接 {address}:{port} 超时")
+                break
+            except OSError:
+                if not self.dns_cache:
+                    raise
+                # 连接失败的地址降级，换下一个健康地址重试
+                self.dns_cache.demote(host, address)
+                if self.dns_cache.healthy_count(host) == 0 or len(tried) >= 3:
+                    raise
+                address = await asyncio.get_running_loop().run_in_executor(None, self.dns_cache.pick, host, port)
+                tried.add(address)
+        self.connections_opened += 1
+        return reader, writer
+
+    async def get(self, url, headers=None, max_redirects=5):
+        """发送GET请求并读取响应头，自动跟随重定向"""
+        for _ in range(max_redirects + 1):
+            parsed = urlparse(url)
+            key = (parsed.scheme, parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80))
+            path = parsed.path or '/'
+            if parsed.query:
+                path += '?' + parsed.query
+            lines = [f"GET {path} HTTP/1.1", f"Host: {parsed.netloc}",
+                     "Accept-Encoding: identity", "Connection: keep-alive"]
+            lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+            request = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+            # 复用的空闲连接可能已被服务器关闭，失败后用新连接重试一次
+            while True:
+                reused = bool(self.idle[key])
+                reader, writer = self.idle[key].pop() if reused else await self.connect(key)
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    self.requests_sent += 1
+                    response = AsyncResponse(self, key, reader, writer)
+                    await with_timeout(response.read_head(), self.timeouts[1], "等待响应头超时")
+                    break
+                except (ConnectionError, TimeoutError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if not reused:
+                        raise
+
+            location = response.headers.get('location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                while await response.read(65536):
+                    pass
+                response.release()
+                url = urljoin(url, location)
+                continue
+            return response
+        raise IOError("重定向次数过多")
+
+
+def merge_ranges(ranges):
+    """合并重叠或相邻的闭区间（区间可以是列表或元组，续传日志读出的是列表）"""
+    merged = []
+    for start, end in sorted(tuple(r) for r in ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(done_ranges, file_size):
+    """根据已完成的区间计算 [0, file_size) 中缺失的闭区间"""
+    gaps = []
+    position = 0
+    for start, end in merge_ranges(done_ranges):
+        if start > position:
+            gaps.append((position, start - 1))
+        position = max(position, end + 1)
+    if position < file_size:
+        gaps.append((position, file_size - 1))
+    return gaps
+
+
+class ContentChangedError(requests.RequestException):
+    """续传时服务器上的文件已变化（If-Range 未命中）"""
+
+
+class LinkExpiredError(requests.RequestException):
+    """固定使用的最终地址返回 403/410（签名地址过期等），需要重新解析源地址"""
+
+
+class StallError(requests.RequestException):
+    """连接的接收速度持续低于下限，已被看门狗断开"""
+
+
+def abort_response(response):
+    """从任意线程中断响应所在的连接，阻塞中的读取会立即以连接关闭结束"""
+    if isinstance(response, AsyncResponse):
+        response.abort()
+        return
+    try:
+        response.raw._connection.sock.shutdown(socket.SHUT_RDWR)
+    except (AttributeError, OSError):
+        pass
+
+
+def signed_url_expiry(url):
+    """从签名地址的查询参数解析过期时间（Unix 时间戳），无法识别时返回 None"""
+    query = {name.lower(): value for name, value in parse_qsl(urlparse(url).query)}
+    try:
+        if 'expires' in query:  # CloudFront、S3 旧版签名等：直接给出过期时间戳
+            return float(query['expires'])
+        for prefix in ('x-amz-', 'x-goog-'):  # S3 / GCS V4 签名：签名时间 + 有效秒数
+            if prefix + 'date' in query and prefix + 'expires' in query:
+                signed_at = calendar.timegm(time.strptime(query[prefix + 'date'], '%Y%m%dT%H%M%SZ'))
+                return signed_at + float(query[prefix + 'expires'])
+        if 'se' in query and 'sig' in query:  # Azure SAS
+            value = query['se'].rstrip('Z')
+            return calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S' if 'T' in value else '%Y-%m-%d'))
+    except ValueError:
+        pass
+    return None
+
+
+class RangeNotSupportedError(requests.RequestException):
+    """服务器声明支持 Range，但没有按请求返回分段（返回 200 完整文件或错误的 Content-Range）"""
+
+
+class DownloadJournal:
+    """断点续传日志：记录已完成的字节区间和 ETag/Last-Modified 校验信息"""
+
+    def __init__(self, path, url, size, etag=None, last_modified=None, done=None):
+        self.path = path
+        self.url = url
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.done = merge_ranges(done or [])
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def path_for(file_path):
+        return file_path.with_name(file_path.name + '.journal')
+
+    @classmethod
+    def load(cls, file_path):
+        """读取目标文件旁的续传日志，不存在或损坏时返回 None"""
+        path = cls.path_for(file_path)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return cls(path, data['url'], data['size'], data.get('etag'), data.get('last_modified'),
+                       data.get('done'))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def matches(self, size, etag, last_modified):
+        """文件大小和校验信息一致，且至少有一个校验信息时才可续传"""
+        if self.size != size or not (etag or last_modified):
+            return False
+        return self.etag == etag and self.last_modified == last_modified
+
+    def if_range(self):
+        """If-Range 请求头的取值：优先使用强 ETag"""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def completed_bytes(self):
+        return sum(end - start + 1 for start, end in self.done)
+
+    def save(self, done):
+        """原子地写入日志"""
+        with self.lock:
+            self.done = merge_ranges(done)
+            data = {
+                "url": self.url,
+                "size": self.size,
+                "etag": self.etag,
+                "last_modified": self.last_modified,
+                "done": self.done
+            }
+            temp_path = self.path.with_name(self.path.name + '.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.path)
+
+    def delete(self):
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+class Segment:
+    """下载分段：[start, end] 闭区间，pos 为下一个待分配的字节偏移"""
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.pos = start  # 已分配给写入的位置
+        self.written = start  # 已确认写入的位置
+        self.active = False  # 是否正由某个线程下载
+        self.done = False
+        self.failures = 0  # 失败次数
+        self.retry_at = 0  # 退避结束时间，之前不会被领取
+        self.started_at = 0  # 本次连接领取分段的时间
+        self.started_pos = start  # 本次连接领取分段时的位置
+        self.primary = None  # 对冲请求：被对冲的原分段
+        self.hedge = None  # 原分段：正在进行的对冲请求
+        self.response = None  # 本次连接正在接收的响应，对冲结束时用于中断落后的一方
+        self.stalled = False  # 本次连接是否因停滞被看门狗断开
+
+    @property
+    def remaining(self):
+        return max(0, self.end - self.pos + 1)
+
+    @property
+    def owner(self):
+        """写入数据所属的分段：对冲请求为原分段，否则为自身"""
+        return self.primary or self
+
+    def start_attempt(self, now):
+        self.active = True
+        self.stalled = False
+        self.started_at = now
+        self.started_pos = self.pos
+
+    def rate(self, now):
+        """本次连接的接收速度（字节/秒）"""
+        elapsed = now - self.started_at
+        return (self.pos - self.started_pos) / elapsed if elapsed > 0 else 0
+
+
+class SegmentScheduler:
+    """动态分段调度器：分段数量与线程数无关，空闲线程可拆分慢速线程剩余最多的分段，
+    无法再拆分时对预计完成时间明显落后的分段发起对冲请求，两个连接谁先收到的字节就用谁的"""
+
+    def __init__(self, file_size, segment_size, min_split_size, done_ranges=None, hedge_ratio=0, hedge_delay=1.0):
+        self.lock = threading.Lock()
+        self.min_split_size = max(1, min_split_size)
+        self.segments = []
+        self.pending = collections.deque()
+        self.steal_count = 0
+        self.hedge_ratio = hedge_ratio  # 预计完成时间超过新连接的多少倍时发起对冲，0=不对冲
+        self.hedge_delay = hedge_delay  # 连接至少运行多少秒后才参与对冲判断（也作为新连接的建立时间估计）
+        self.hedge_count = 0  # 发起对冲的次数
+        self.hedge_wins = 0  # 对冲请求先完成的次数
+        self.hedge_wasted = 0  # 两个连接重复收到而被丢弃的字节数
+        self.rates = collections.deque(maxlen=32)  # 最近完成的连接的接收速度
+        self.parked = {}  # 留下等待对冲时机的空闲连接标识 -> 租约到期时间
+        self.done_ranges = merge_ranges(done_ranges or [])  # 续传前已完成的范围
+        for gap_start, gap_end in missing_ranges(self.done_ranges, file_size):
+            for start in range(gap_start, gap_end + 1, max(1, segment_size)):
+                end = min(start + segment_size - 1, gap_end)
+                segment = Segment(len(self.segments), start, end)
+                self.segments.append(segment)
+                self.pending.append(segment)
+
+    def completed_ranges(self):
+        """返回已写入的字节范围（含续传前已完成的部分）"""
+        with self.lock:
+            ranges = [(seg.start, seg.written - 1) for seg in self.segments if seg.written > seg.start]
+        return merge_ranges(self.done_ranges + ranges)
+
+    def acquire(self):
+        """领取一个分段；没有待下载分段时窃取剩余最多的活动分段的后半部分"""
+        with self.lock:
+            now = time.time()
+            for segment in self.pending:
+                if segment.retry_at <= now:
+                    self.pending.remove(segment)
+                    segment.start_attempt(now)
+                    return segment
+
+            candidates = [seg for seg in self.segments if seg.active and not seg.done and seg.hedge is None
+                          and seg.remaining >= 2 * self.min_split_size]
+            if not candidates:
+                return self.hedge(now)
+
+            victim = max(candidates, key=lambda seg: seg.remaining)
+            middle = victim.pos + victim.remaining // 2
+            segment = Segment(len(self.segments), middle, victim.end)
+            victim.end = middle - 1
+            segment.start_attempt(now)
+            self.segments.append(segment)
+            self.steal_count += 1
+            return segment
+
+    def hedge(self, now):
+        """为预计完成时间最落后的分段创建对冲请求（调用方持有锁），没有需要对冲的分段时返回 None"""
+        if not self.hedge_ratio or not self.rates:
+            return None
+        typical = statistics.median(self.rates)
+        victim, victim_lag = None, 0
+        for seg in self.hedge_candidates(now):
+            rate = seg.rate(now)
+            eta = seg.remaining / rate if rate > 0 else float('inf')
+            fresh = seg.remaining / typical + self.hedge_delay if typical > 0 else float('inf')
+            if eta > self.hedge_ratio * fresh and eta - fresh > victim_lag:
+                victim, victim_lag = seg, eta - fresh
+        if victim is None:
+            return None
+
+        # 对冲请求与原分段共用写入位置和临时文件，不加入分段列表
+        segment = Segment(victim.index, victim.pos, victim.end)
+        segment.primary = victim
+        segment.start_attempt(now)
+        victim.hedge = segment
+        self.hedge_count += 1
+        return segment
+
+    def hedge_candidates(self, now):
+        """正在下载、尚未被对冲且已运行足够长时间的分段"""
+        return [seg for seg in self.segments if seg.active and not seg.done and seg.hedge is None
+                and seg.remaining > 0 and now - seg.started_at >= self.hedge_delay]
+
+    def reserve(self, segment, size):
+        """为写入预留字节范围，返回 (偏移, 长度, 重复字节数)；长度为0表示分段已完成或被拆分。
+        对冲中的两个连接各自按顺序接收，对方已领取的部分为重复数据，调用方跳过不写"""
+        with self.lock:
+            owner = segment.owner
+            if owner.done:
+                return segment.pos, 0, 0
+            length = min(size, segment.remaining)
+            offset = segment.pos
+            segment.pos += length
+            duplicate = 0
+            if owner.hedge is not None:
+                other = owner.hedge if segment is owner else owner
+                duplicate = min(length, max(0, other.pos - offset))
+                self.hedge_wasted += duplicate
+            return offset, length, duplicate
+
+    def complete(self, segment):
+        """标记分段完成；处于对冲中时返回落后一方的连接，由调用方中断"""
+        with self.lock:
+            owner = segment.owner
+            if owner.done:
+                return None
+            now = time.time()
+            if now > segment.started_at:
+                self.rates.append(segment.rate(now))
+            owner.active = False
+            owner.done = True
+            loser = None
+            if owner.hedge is not None:
+                loser = owner if segment is owner.hedge else owner.hedge
+                if segment is owner.hedge:
+                    self.hedge_wins += 1
+                owner.hedge = None
+            return loser
+
+    def detach(self, segment):
+        """连接出错时调用：分段已由对冲的另一方完成或另一方仍在下载时返回 True（无需重试），
+        否则返回 False，由调用方按普通失败处理原分段"""
+        with self.lock:
+            owner = segment.owner
+            if owner.done:
+                return True
+            if segment is owner.hedge:
+                owner.hedge = None
+                return owner.active
+            if owner.hedge is not None:
+                owner.active = False  # 对冲请求接手剩余部分
+                return True
+            return False
+
+    def requeue(self, segment, delay=0):
+        """分段失败，退避 delay 秒后从已写入位置重新排队"""
+        with self.lock:
+            segment = segment.owner
+            segment.active = False
+            segment.pos = segment.written
+            segment.retry_at = time.time() + delay
+            self.pending.appendleft(segment)
+
+    def has_work(self):
+        """是否还有可领取的分段或可拆分的活动分段（新增连接是否有事可做）"""
+        with self.lock:
+            return bool(self.pending) or any(seg.active and not seg.done and seg.hedge is None
+                                             and seg.remaining >= 2 * self.min_split_size for seg in self.segments)
+
+    def retry_wait(self, key):
+        """还有处于退避中的分段或可能需要对冲的分段时返回需要等待的秒数，否则返回 None（调用方退出）。
+        留下等待对冲的空闲连接（按 key 区分）不超过尚未对冲的分段数，其余退出，不在共享线程池中长期占用线程"""
+        with self.lock:
+            now = time.time()
+            waits = [max(0.0, seg.retry_at - now) for seg in self.pending]
+            if self.hedge_ratio:
+                unhedged = sum(1 for seg in self.segments if seg.active and not seg.done and seg.hedge is None)
+                # 租约在连接领到分段或退出后自动过期
+                self.parked = {other: until for other, until in self.parked.items() if until > now and other != key}
+                if len(self.parked) < unhedged:
+                    self.parked[key] = now + 1.0
+                    waits.append(0.2)  # 空闲连接留下来等待对冲时机
+            return min(waits) if waits else None
+
+
+class ConnectionBudget:
+    """全局连接预算：限制多个任务同时打开的下载连接总数，线程和协程共用，按先来先得分配名额"""
+
+    def __init__(self, limit):
+        self.limit = max(1, limit)
+        self.in_use = 0
+        self.waiting = collections.deque()  # 排队等待名额的票据（协程的票据为其事件循环和唤醒事件）
+        self.condition = threading.Condition()
+
+    def acquire(self, stopped=None):
+        """等待空闲名额；等待期间任务被停止时返回 False"""
+        ticket = object()
+        with self.condition:
+            self.waiting.append(ticket)
+            try:
+                while self.in_use >= self.limit or self.waiting[0] is not ticket:
+                    if stopped and stopped():
+                        return False
+                    self.condition.wait(0.05)
+                self.in_use += 1
+                return True
+            finally:
+                self.waiting.remove(ticket)
+                self.notify()
+
+    async def acquire_async(self, stopped=None):
+        """协程版 acquire：排到队首且有空闲名额时由释放名额的线程或协程通过事件循环唤醒，不阻塞事件循环"""
+        event = asyncio.Event()
+        ticket = (asyncio.get_running_loop(), event)
+        with self.condition:
+            self.waiting.append(ticket)
+        try:
+            while True:
+                with self.condition:
+                    if self.in_use < self.limit and self.waiting[0] is ticket:
+                        self.in_use += 1
+                        return True
+                    event.clear()
+                if stopped and stopped():
+                    return False
+                try:
+                    await asyncio.wait_for(event.wait(), 0.05)  # 超时只用于检查任务是否已停止
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self.condition:
+                self.waiting.remove(ticket)
+                self.notify()
+
+    def release(self):
+        with self.condition:
+            self.in_use -= 1
+            self.notify()
+
+    def notify(self):
+        """名额或队首变化时唤醒等待者（调用时须持有 condition）：线程通过条件变量，队首的协程通过其事件循环"""
+        self.condition.notify_all()
+        if self.waiting and self.in_use < self.limit and isinstance(self.waiting[0], tuple):
+            loop, event = self.waiting[0]
+            loop.call_soon_threadsafe(event.set)
+
+
+class TokenBucket:
+    """令牌桶限速器：按批量字节数扣减令牌（允许欠账），返回需要等待的时间；速率可在运行时调整"""
+
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = 0  # 字节/秒，0 表示不限速
+        self.capacity = 0
+        self.tokens = 0
+        self.updated = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.refill()
+            self.rate = max(0, rate)
+            self.capacity = max(64 * 1024, self.rate * 0.2)  # 最多积攒约 200 毫秒的突发量
+            self.tokens = min(self.tokens, self.capacity)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, nbytes):
+        """扣减 nbytes 个令牌，返回为偿还欠账需要等待的秒数"""
+        with self.lock:
+            if self.rate <= 0:
+                return 0
+            self.refill()
+            self.tokens -= nbytes
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class ConcurrencyController:
+    """AIMD 自适应连接数：从少量连接开始，总速度仍在上升时每个周期加一个连接，不再上升时退回并保持一段时间；
+    遇到 429/503、连接被重置或单连接速度骤降时连接数减半"""
+
+    def __init__(self, initial=2, minimum=1, maximum=32, interval=1.0, gain=0.05, hold=5, log=None):
+        self.lock = threading.Lock()
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)  # 当前目标连接数
+        self.interval = interval  # 采样周期（秒）
+        self.gain = gain  # 加连接后总速度至少提高的比例，否则视为已饱和
+        self.hold = hold  # 饱和或退避后保持多少个周期再继续试探
+        self.log = log or (lambda message: None)
+        self.excess = 0  # 需要在分段边界退出的连接数
+        self.last_sample = None  # 上次采样的 (时间, 累计字节)
+        self.last_rate = 0  # 上个周期的总速度
+        self.last_per_connection = 0  # 上个周期的单连接速度
+        self.probing = False  # 上个周期是否试探性地加了连接
+        self.hold_until = 0  # 保持期结束前不再试探加连接
+        self.cooldown_until = 0  # 冷却期结束前不再减半
+        self.peak = self.limit
+        self.decreases = 0
+
+    def update(self, total_bytes, running, now=None):
+        """按采样周期调整目标连接数，running 为正在运行的连接数；返回目标连接数"""
+        now = now or time.time()
+        with self.lock:
+            if self.last_sample is None:
+                self.last_sample = (now, total_bytes)
+            elif now - self.last_sample[0] >= self.interval:
+                rate = (total_bytes - self.last_sample[1]) / (now - self.last_sample[0])
+                self.last_sample = (now, total_bytes)
+                self.adjust(rate, running, now)
+            self.excess = max(0, running - self.limit)
+            return self.limit
+
+    def adjust(self, rate, running, now):
+        """根据本周期总速度调整目标连接数（调用方持有锁）"""
+        per_connection = rate / running if running else 0
+        if running < self.limit:
+            pass  # 剩余分段不足以占满连接（尾部），只记录速度
+        elif (self.last_per_connection and per_connection < self.last_per_connection * 0.5
+              and rate < self.last_rate * 0.7):
+            self.decrease("单连接速度骤降", now)
+            rate = per_connection = 0  # 下个周期重新建立基准
+        elif now < self.hold_until:
+            pass
+        elif self.probing and rate <= self.last_rate * (1 + self.gain):
+            # 加连接没有带来提升：退回上一个连接数并保持一段时间
+            self.probing = False
+            self.limit = max(self.minimum, self.limit - 1)
+            self.hold_until = now + self.hold * self.interval
+            self.log(f"自适应连接数: 总速度不再上升，保持 {self.limit} 个连接")
+        elif self.limit < self.maximum:
+            # 总速度仍在上升，或保持期已过：再加一个连接试探
+            self.limit += 1
+            self.peak = max(self.peak, self.limit)
+            self.probing = True
+        else:
+            self.probing = False  # 已达上限，保持
+        self.last_rate = rate
+        self.last_per_connection = per_connection
+
+    def decrease(self, reason, now):
+        """乘性减小（调用方持有锁），同一波拥塞的后续信号在冷却期内忽略"""
+        if now < self.cooldown_until:
+            return
+        limit = max(self.minimum, self.limit // 2)
+        self.probing = False
+        self.hold_until = now + self.hold * self.interval
+        self.cooldown_until = now + 2 * self.interval
+        if limit < self.limit:
+            self.decreases += 1
+            self.log(f"自适应连接数: {reason}，连接数 {self.limit} -> {limit}")
+            self.limit = limit
+
+    def congestion(self, reason):
+        """服务器限流或连接被重置时调用"""
+        with self.lock:
+            self.decrease(reason, time.time())
+            self.last_rate = self.last_per_connection = 0
+
+    def retire(self):
+        """连接数超过目标时返回 True（每次只让一个连接退出），调用方在分段边界退出"""
+        with self.lock:
+            if self.excess > 0:
+                self.excess -= 1
+                return True
+            return False
+
+
+class StallWatchdog:
+    """连接停滞看门狗：登记的连接在接收上累计 stall_time 秒速度低于 floor 时中断该连接，由接收方从断点续传；
+    连接在限速等待中的时间不计入（限速时连接变慢是预期的）"""
+
+    def __init__(self, floor=4096, stall_time=15, interval=1.0):
+        self.lock = threading.Lock()
+        self.floor = floor  # 速度下限（字节/秒）
+        self.stall_time = stall_time  # 持续低于下限多少秒视为停滞
+        self.interval = interval
+        self.connections = {}  # key -> 连接的检测状态
+        self.thread = None
+
+    def watch(self, key, response, progress, on_stall):
+        """登记连接；progress() 返回已收到的字节数，停滞时先调用 on_stall() 再中断连接"""
+        with self.lock:
+            self.connections[key] = {"response": response, "progress": progress, "on_stall": on_stall,
+                                     "bytes": progress(), "time": time.monotonic(), "slow_time": 0.0,
+                                     "waited": 0.0, "waiting_since": None}
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def unwatch(self, key):
+        with self.lock:
+            self.connections.pop(key, None)
+
+    def pause(self, key):
+        """连接开始限速等待，等待时间不计入检测"""
+        with self.lock:
+            watched = self.connections.get(key)
+            if watched and watched["waiting_since"] is None:
+                watched["waiting_since"] = time.monotonic()
+
+    def resume(self, key):
+        """连接结束限速等待"""
+        with self.lock:
+            watched = self.connections.get(key)
+            if watched and watched["waiting_since"] is not None:
+                watched["waited"] += time.monotonic() - watched["waiting_since"]
+                watched["waiting_since"] = None
+
+    def run(self):
+        """检测线程：没有登记的连接时退出，下次登记时重新启动"""
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.connections:
+                    self.thread = None
+                    return
+            for watched in self.check(time.monotonic()):
+                watched["on_stall"]()
+                abort_response(watched["response"])
+
+    def check(self, now):
+        """更新各连接的速度，返回已停滞（并已注销）的连接"""
+        stalled = []
+        with self.lock:
+            for key, watched in list(self.connections.items()):
+                received = watched["progress"]()
+                elapsed = now - watched["time"]
+                if elapsed <= 0:
+                    continue
+                # 只按连接实际在接收的时间计算速度
+                waited = watched["waited"]
+                if watched["waiting_since"] is not None:
+                    waited += now - max(watched["waiting_since"], watched["time"])
+                    watched["waiting_since"] = now
+                active = max(0.0, elapsed - waited)
+                rate = (received - watched["bytes"]) / active if active > 0 else None
+                watched["bytes"], watched["time"], watched["waited"] = received, now, 0.0
+                if rate is None:
+                    continue  # 整个周期都在限速等待
+                if rate >= self.floor:
+                    watched["slow_time"] = 0.0
+                    continue
+                watched["slow_time"] += active
+                if watched["slow_time"] >= self.stall_time:
+                    del self.connections[key]
+                    stalled.append(watched)
+        return stalled
+
+
+class Mirror:
+    """镜像地址及其本轮传输统计"""
+
+    def __init__(self, url, source=None):
+        self.url = url  # 重定向后固定使用的最终地址
+        self.source = source or url  # 用户填写的源地址，最终地址失效时重新解析
+        self.refreshed_at = 0  # 上次重新解析的时间
+        self.bytes = 0  # 已传输字节数
+        self.busy_time = 0.0  # 分段传输累计耗时
+        self.active = 0  # 正在使用的连接数
+        self.errors = 0  # 本轮累计出错次数
+        self.consecutive_errors = 0  # 连续出错次数，成功传输数据后清零
+        self.dropped = False
+
+    @property
+    def rate(self):
+        """单连接平均速度（字节/秒），尚无数据时返回 None"""
+        return self.bytes / self.busy_time if self.busy_time > 0 else None
+
+
+class MirrorPool:
+    """多镜像分段调度：分段优先分配给速度快的镜像，连续出错或明显偏慢的镜像会被剔除"""
+
+    def __init__(self, urls, log=None, max_errors=3, slow_ratio=0.25, min_sample_bytes=4 * 1024 * 1024):
+        self.lock = threading.Lock()
+        self.mirrors = [Mirror(final, source) for source, final in urls]  # urls 为 (源地址, 最终地址)
+        self.log = log or (lambda message: None)
+        self.max_errors = max_errors
+        self.slow_ratio = slow_ratio
+        self.min_sample_bytes = min_sample_bytes
+        self.started = time.time()
+
+    def choose(self):
+        """选择镜像：未测速的镜像优先试用，其余按 单连接速度/(活动连接数+1) 选最优"""
+        with self.lock:
+            alive = [mirror for mirror in self.mirrors if not mirror.dropped]
+            untested = [mirror for mirror in alive if mirror.rate is None and mirror.active == 0]
+            if untested:
+                mirror = untested[0]
+            else:
+                mirror = max(alive, key=lambda m: (m.rate or 0) / (m.active + 1))
+            mirror.active += 1
+            return mirror
+
+    def release(self, mirror, nbytes, elapsed, failed=False):
+        """记录一次分段传输的结果，并剔除连续出错或明显偏慢的镜像"""
+        with self.lock:
+            mirror.active -= 1
+            mirror.bytes += nbytes
+            mirror.busy_time += elapsed
+            if failed:
+                mirror.errors += 1
+                mirror.consecutive_errors += 1
+            elif nbytes > 0:
+                mirror.consecutive_errors = 0
+
+            others = [m for m in self.mirrors if m is not mirror and not m.dropped]
+            if mirror.dropped or not others:
+                return  # 至少保留一个镜像
+
+            if mirror.consecutive_errors >= self.max_errors:
+                mirror.dropped = True
+                self.log(f"镜像连续出错 {mirror.consecutive_errors} 次，已剔除: {mirror.url}")
+                return
+
+            measured = [m.rate for m in others if m.rate and m.bytes >= self.min_sample_bytes]
+            if mirror.bytes >= self.min_sample_bytes and measured and mirror.rate < self.slow_ratio * max(measured):
+                mirror.dropped = True
+                self.log(f"镜像速度明显偏慢，已剔除: {mirror.url}")
+
+    def speeds(self):
+        """各镜像本轮承担的总吞吐量（字节/秒）"""
+        elapsed = max(1e-6, time.time() - self.started)
+        with self.lock:
+            return {m.url: m.bytes / elapsed for m in self.mirrors}
+
+    def summary(self):
+        with self.lock:
+            return [(m.url, m.bytes, m.rate or 0, m.errors, m.dropped) for m in self.mirrors]
+
 
 class DownloadManager:
+    _read_buffers = threading.local()  # 每个工作线程一块接收缓冲区，跨分段、跨轮次（及共享线程池中的各任务）复用
+
     def __init__(self, gui_callback=None):
         self.url = ""
+        self.mirrors = []  # 与 url 内容相同的镜像地址，分段会分散到各镜像下载
+        self.mirror_pool = None  # 本轮多镜像调度
         self.download_path = "D:\\"
         self.delete_time = 0
         self.active = False
+        self.stop_event = threading.Event()  # 停止请求，各处等待都可被其立即唤醒
         self.stop_requested = False
         self.download_thread = None
-        self.delete_timer = None
         self.download_progress = {"percent": 0, "downloaded": 0, "total": 0, "speed": 0}
         self.last_update_time = 0
         self.last_downloaded = 0
@@ -34,13 +1242,77 @@ class DownloadManager:
         self.download_completed = False
         self.thread_count = 4  # 默认线程数
         self.use_multithread = False  # 是否启用多线程
+        self.output_mode = "preallocate"  # 输出模式: "preallocate"=预分配目标文件按偏移直写, "parts"=分块临时文件后合并, "discard"=仅产生流量不落盘
         self.chunks = []  # 用于多线程下载的分块信息
         self.lock = threading.Lock()  # 线程锁
-        self.chunk_queue = queue.Queue()  # 用于分块下载的队列
+        self.scheduler = None  # 分段调度器
+        self.session = None  # 长期复用的HTTP会话（跨分块与重启周期）
+        self.adapter = None  # 会话使用的连接池适配器
+        self.engine = "thread"  # 下载引擎: "thread"=线程池, "asyncio"=共享事件循环上的协程
+        self.async_client = None  # asyncio引擎使用的HTTP客户端（跨周期复用连接）
+        self.async_future = None  # 正在运行的asyncio下载任务
+        self.resume_enabled = True  # 断点续传（预分配多线程模式下记录续传日志）
+        self.journal = None  # 当前下载的续传日志
+        self.journal_interval = 1.0  # 续传日志保存间隔（秒）
+        self.journal_saved_at = 0
+        self.transfer_error = None  # 本轮分段传输中出现的错误
+        self.merge_workers = 4  # 并行合并分块文件的线程数
+        self.segment_max_retries = 5  # 单个分段的最大重试次数
+        self.retry_budget = 30  # 每轮下载允许的分段重试总次数
+        self.retry_base_delay = 0.5  # 重试退避的初始时间（秒）
+        self.retry_max_delay = 30  # 重试退避的最大时间（秒）
+        self.retries_left = 0  # 本轮剩余的重试次数
+        self.host_failures = collections.Counter()  # 各主机的分段失败次数
+        self.buffer_size = 0  # 接收缓冲区大小（字节），0=在 256KB-4MB 之间自动调整
+        self.rate_limit_mbps = 0  # 本任务目标速率（Mbps），0=不限速
+        self.rate_limiter = TokenBucket()  # 本任务限速器
+        self.global_limiter = None  # 任务队列提供的全局限速器
+        self.segment_size = 4 * 1024 * 1024  # 分段大小（与线程数无关）
+        self.min_split_size = 512 * 1024  # 窃取拆分后每段的最小字节数
+        self.hedge_ratio = 2.0  # 尾部对冲：分段预计完成时间超过新连接的多少倍时由空闲连接重复请求剩余部分，0=关闭
+        self.hedge_delay = 1.0  # 连接至少运行多少秒后才判断是否需要对冲
+        self.auto_connections = False  # 自适应连接数：thread_count 作为上限，下载过程中按 AIMD 增减连接
+        self.auto_initial_connections = 2  # 自适应连接数的初始连接数
+        self.concurrency = None  # 自适应连接数控制器（跨周期保留学到的连接数）
+        self.connect_timeout = 10  # 建立连接的超时（秒）
+        self.read_timeout = 30  # 两次收到数据之间的最长等待（秒）
+        self.stall_speed = 4 * 1024  # 单连接速度下限（字节/秒）
+        self.stall_time = 15  # 速度持续低于下限多少秒视为停滞并断开重连，0=不检测
+        self.stall_count = 0  # 本轮因停滞断开的连接数
+        self.watchdog = StallWatchdog()
         self.executor = None  # 线程池执行器
+        self.shared_executor = None  # 任务队列提供的共享线程池（为 None 时每轮自建）
+        self.connection_budget = None  # 任务队列提供的全局连接预算
+        self.total_downloaded = 0  # 累计下载字节数（跨所有周期）
+        self.dns_cache = DNSCache()  # 域名解析缓存，分段连接分散到全部解析地址
+        self.source_addresses = []  # 本地源地址或网卡名，新连接分散绑定到这些地址（为空时使用默认路由）
+        self.source_mode = "round_robin"  # 源地址分配方式: "round_robin"=轮转, "throughput"=按实测吞吐量
+        self.source_pool = None  # 当前使用的源地址池
+        self.metadata_cache = {}  # 源地址 -> 文件元数据（最终地址、文件名、大小、校验信息、是否支持分段）
+        self.metadata_ttl = 300  # 元数据缓存有效期（秒），过期后重新 HEAD
+        self.no_range_hosts = set()  # 实际不支持 Range 的主机，之后对其只使用单线程下载
+        self.expiry_margin = 60  # 签名地址到期前多少秒视为失效，提前重新解析
+        self.resolve_lock = threading.Lock()  # 最终地址失效时避免多个线程同时重新解析
+        self.metadata = None  # 本轮使用的主地址元数据
+        self.probe_mode = "get"  # 获取文件信息的方式: "get"=第一个分段的 Range GET 同时获取信息和数据, "head"=先 HEAD 再下载
+        self.async_task = None  # 正在运行的协程下载任务，停止时在事件循环上取消
+        self.probe_response = None  # 探测请求尚未读取的响应，交给第一个分段继续接收
+        self.probe_range = (0, -1)  # 探测响应覆盖的字节范围
         self.restart_count = 0  # 重启计数器
+        self.turnarounds = collections.deque(maxlen=1000)  # 最近各轮的周期切换耗时（秒，不含等待删除时间）
         self.file_deletion_attempts = 0  # 文件删除尝试次数
 
+    @property
+    def stop_requested(self):
+        return self.stop_event.is_set()
+
+    @stop_requested.setter
+    def stop_requested(self, value):
+        if value:
+            self.stop_event.set()
+        else:
+            self.stop_event.clear()
+
     @staticmethod
     def validate_url(url):
         """验证URL格式是否有效"""
@@ -88,81 +1360,148 @@ class DownloadManager:
         }
         return extensions.get(content_type, '.bin')
 
+    def get_session(self):
+        """获取长期复用的HTTP会话，连接池大小与线程数一致；源地址设置变化时重建"""
+        sources = (list(self.source_addresses), self.source_mode)
+        pool_sources = (self.source_pool.sources, self.source_pool.mode) if self.source_pool else ([], self.source_mode)
+        if self.session is None or self.adapter._pool_maxsize < self.thread_count or sources != pool_sources:
+            if self.session is not None:
+                self.session.close()
+            self.source_pool = SourceAddressPool(*sources) if self.source_addresses else None
+            if self.async_client:
+                self.async_client.source_pool = self.source_pool
+            self.adapter = PooledHTTPAdapter(self.thread_count, self.dns_cache, self.source_pool)
+            self.session = requests.Session()
+            self.session.mount('http://', self.adapter)
+            self.session.mount('https://', self.adapter)
+        return self.session
+
+    def connection_stats(self):
+        """返回连接复用统计：新建连接数、请求数、复用次数"""
+        stats = self.adapter.stats() if self.adapter else {"connections": 0, "requests": 0, "reused": 0}
+        if self.async_client:
+            stats["connections"] += self.async_client.connections_opened
+            stats["requests"] += self.async_client.requests_sent
+            stats["reused"] = max(0, stats["requests"] - stats["connections"])
+        return stats
+
     def download_file(self):
-        """执行文件下载操作"""
+        """执行文件下载操作：周期引擎在本线程中循环 下载 -> 等待 -> 删除 -> 重新下载，
+        各轮复用同一个线程、线程池和HTTP会话"""
         self.active = True
         self.stop_requested = False
         self.is_restarting = False
-        self.download_completed = False
-        self.restart_count += 1  # 增加重启计数器
-        self.file_deletion_attempts = 0  # 重置文件删除尝试次数
+        self.start_cycle()
+        session = self.get_session()
+        cycle_stats = self.connection_stats()
+        failures = 0  # 连续失败的下载次数，决定重试前的退避时间
+        cycle_end, held = None, 0  # 上一轮传输结束的时间、之后等待删除的时长
 
         try:
             while not self.stop_requested:
-                # 获取文件信息
-                with requests.head(self.url, allow_redirects=True) as response:
-                    response.raise_for_status()
-                    filename = self.get_filename(self.url, response.headers)
+                # 一轮下载（含获取文件信息）中的网络错误都按失败处理，指数退避后重试
+                try:
+                    # 获取文件信息（有效期内复用上一轮的结果，省去 HEAD 与重定向的往返）
+                    self.close_probe_response()
+                    self.metadata = self.fetch_metadata(self.url, probe=self.probe_mode == "get")
+                    filename = self.metadata["filename"]
                     file_path = Path(self.download_path) / filename
-                    content_length = int(response.headers.get('Content-Length', 0))
+                    content_length = self.metadata["content_length"]
+                    etag = self.metadata["etag"]
+                    last_modified = self.metadata["last_modified"]
                     self.current_file = file_path
 
                     # 检查是否支持多线程下载
-                    supports_range = 'bytes' in response.headers.get('Accept-Ranges', '')
+                    supports_range = (self.metadata["supports_range"]
+                                      and urlparse(self.metadata["url"]).hostname not in self.no_range_hosts)
                     if self.use_multithread and supports_range and content_length > 1024 * 1024:  # 大于1MB才使用多线程
-                        self.log_message(f"文件支持多线程下载，将使用 {self.thread_count} 个线程")
+                        if self.auto_connections:
+                            self.log_message(f"文件支持多线程下载，将自动调整连接数（上限 {self.thread_count}）")
+                        else:
+                            self.log_message(f"文件支持多线程下载，将使用 {self.thread_count} 个线程")
+                        mirror_urls = [(self.url, self.metadata["url"])] + self.validate_mirrors(content_length, etag,
+                                                                                                 last_modified)
+                        self.mirror_pool = MirrorPool(mirror_urls, self.log_message)
+                        if len(mirror_urls) > 1:
+                            self.log_message(f"将从 {len(mirror_urls)} 个镜像分段下载")
                     else:
                         self.use_multithread = False
                         self.log_message("文件不支持多线程下载或文件太小，使用单线程下载")
 
-                # 重置进度信息
-                self.download_progress = {
-                    "percent": 0,
-                    "downloaded": 0,
-                    "total": content_length,
-                    "speed": 0
-                }
-                self.last_update_time = time.time()
-                self.last_downloaded = 0
-
-                # 处理文件存在的情况
-                if file_path.exists():
-                    # 如果是重启后再次发现文件存在，尝试强制删除
-                    if self.is_restarting:
-                        self.log_message(f"重启后文件仍然存在: {file_path}")
-                        if self.try_delete_file(file_path):
-                            continue  # 文件删除成功，重新开始循环
+                    # 重置进度信息
+                    self.download_progress = {
+                        "percent": 0,
+                        "downloaded": 0,
+                        "total": content_length,
+                        "speed": 0
+                    }
+                    self.last_update_time = time.time()
+                    self.last_downloaded = 0
+
+                    # 检查是否有可续传的未完成下载
+                    journal = None
+                    resuming = False
+                    if self.resume_enabled and self.use_multithread and self.output_mode == "preallocate":
+                        journal = DownloadJournal.load(file_path)
+                        if journal and file_path.exists() and journal.matches(content_length, etag, last_modified):
+                            resuming = True
+                            self.download_progress["downloaded"] = journal.completed_bytes()
+                            self.last_downloaded = journal.completed_bytes()
+                            self.log_message(f"发现未完成的下载，已完成 {self.format_bytes(journal.completed_bytes())}，"
+                                             f"继续下载剩余部分")
                         else:
-                            break  # 文件删除失败，停止下载
-
-                    # 第一次发现文件存在，询问用户
-                    self.log_message(f"文件已存在: {file_path}")
-
-                    # 确保在GUI线程中显示对话框
-                    if self.gui_callback:
-                        # 使用回调函数获取用户选择
-                        self.log_message("正在等待用户确认...")
-                        choice = self.gui_callback("file_exists", f"文件已存在: {file_path}\n是否删除?")
-                    else:
-                        choice = input("是否删除? (y/n): ").lower() == 'y'
-
-                    if choice:
-                        if self.try_delete_file(file_path):
-                            self.is_restarting = True
-                            continue  # 文件删除成功，重新开始循环
+                            if journal:
+                                # 日志与服务器文件不一致，旧的未完成文件无法续传
+                                self.log_message("续传日志与服务器文件不一致，重新下载")
+                                journal.delete()
+                                if file_path.exists() and not self.try_delete_file(file_path):
+                                    break
+                            journal = DownloadJournal(DownloadJournal.path_for(file_path), self.url,
+                                                      content_length, etag, last_modified)
+
+                    # 处理文件存在的情况（仅流量模式不写文件，无需处理）
+                    if file_path.exists() and not resuming and self.output_mode != "discard":
+                        # 如果是重启后再次发现文件存在，尝试强制删除
+                        if self.is_restarting:
+                            self.log_message(f"重启后文件仍然存在: {file_path}")
+                            if self.try_delete_file(file_path):
+                                continue  # 文件删除成功，重新开始循环
+                            else:
+                                break  # 文件删除失败，停止下载
+
+                        # 第一次发现文件存在，询问用户
+                        self.log_message(f"文件已存在: {file_path}")
+
+                        # 确保在GUI线程中显示对话框
+                        if self.gui_callback:
+                            # 使用回调函数获取用户选择
+                            self.log_message("正在等待用户确认...")
+                            choice = self.gui_callback("file_exists", f"文件已存在: {file_path}\n是否删除?")
                         else:
-                            break  # 文件删除失败，停止下载
-                    else:
-                        self.log_message("停止下载任务")
-                        break
+                            choice = input("是否删除? (y/n): ").lower() == 'y'
+
+                        if choice:
+                            if self.try_delete_file(file_path):
+                                self.is_restarting = True
+                                continue  # 文件删除成功，重新开始循环
+                            else:
+                                break  # 文件删除失败，停止下载
+                        else:
+                            self.log_message("停止下载任务")
+                            break
 
-                # 执行下载
-                try:
+                    # 执行下载
                     self.log_message(f"开始下载: {self.url}")
                     start_time = time.time()
+                    if cycle_end is not None:
+                        turnaround = start_time - cycle_end - held
+                        self.turnarounds.append(turnaround)
+                        self.download_progress["turnaround"] = turnaround
+                        self.log_message(f"周期切换耗时: {turnaround * 1000:.0f} 毫秒（不含等待删除时间）")
+                        cycle_end = None
 
                     if self.use_multithread:
-                        self.download_file_multithread(file_path, content_length)
+                        self.download_file_multithread(file_path, content_length, journal)
                     else:
                         self.download_file_singlethread(file_path)
 
@@ -179,30 +1518,271 @@ class DownloadManager:
                         avg_speed = self.download_progress['downloaded'] / download_time
                         self.log_message(f"平均速度: {self.format_bytes(avg_speed)}/s")
 
+                    stats = self.connection_stats()
+                    self.log_message(f"本轮新建连接: {stats['connections'] - cycle_stats['connections']}, "
+                                     f"请求数: {stats['requests'] - cycle_stats['requests']}, "
+                                     f"累计复用: {stats['reused']}")
+                    cycle_stats = stats
+
                     # 标记下载完成
                     self.download_completed = True
+                    failures = 0
+                    cycle_end = time.time()
 
-                    # 设置自动删除
-                    if self.delete_time > 0:
+                    # 未设置自动删除时只下载一次；仅流量模式没有文件需要删除，等待删除时间（0 为立即）后直接开始下一轮
+                    discard = self.output_mode == "discard"
+                    if not discard and self.delete_time <= 0:
+                        break
+                    if not discard:
                         self.log_message(f"文件将在 {self.delete_time} 秒后自动删除")
-                        self.schedule_file_deletion(file_path)
-                        break  # 退出下载循环，等待删除完成
-                    else:
-                        self.active = False
-                        return
+                    if self.delete_time > 0 and not self.show_progress(self.delete_time):
+                        break
+                    held = time.time() - cycle_end
+                    if not discard:
+                        if not self.delete_finished_file(file_path):
+                            break
+                        self.is_restarting = True
+                    self.start_cycle()
+                    if self.gui_callback:
+                        self.gui_callback("download_started", None)
+                    continue
 
                 except requests.RequestException as e:
-                    self.log_message(f"\n下载失败: {str(e)}")
-                    time.sleep(5)  # 等待后重试
+                    if self.stop_requested:
+                        break  # 停止时连接被中断，不算下载失败
+                    failures += 1
+                    delay = self.backoff_delay(failures)
+                    self.log_message(f"\n下载失败: {str(e)}，{delay:.1f} 秒后重试")
+                    self.metadata_cache.pop(self.url, None)  # 出错后重新获取文件信息（地址或文件可能已变化）
+                    self.stop_event.wait(delay)  # 指数退避后重试（停止时立即结束等待）
                     continue
 
         except Exception as e:
             self.log_message(f"下载过程中发生未处理的异常: {str(e)}")
             self.log_message(traceback.format_exc())
         finally:
+            self.close_probe_response()
+            # 周期引擎结束时才关闭各轮复用的线程池（共享线程池由任务队列管理）
+            if self.executor and self.executor is not self.shared_executor:
+                self.executor.shutdown(wait=False)
+            self.executor = None
             self.active = False
             self.current_file = None
 
+    def start_cycle(self):
+        """开始新一轮下载：增加重启计数，重置本轮状态"""
+        self.restart_count += 1
+        self.download_completed = False
+        self.file_deletion_attempts = 0
+
+    def turnaround_stats(self):
+        """返回周期切换耗时统计（秒）：上一轮结束到下一轮开始传输之间，除等待删除时间外的开销"""
+        if not self.turnarounds:
+            return None
+        return {
+            "cycles": len(self.turnarounds),
+            "last": self.turnarounds[-1],
+            "average": sum(self.turnarounds) / len(self.turnarounds),
+            "max": max(self.turnarounds)
+        }
+
+    def fetch_metadata(self, url, probe=False):
+        """获取文件元数据（重定向后的最终地址、文件名、大小、校验信息、是否支持分段），有效期内直接使用缓存；
+        probe 为 True 时用第一个分段的 Range GET 代替 HEAD，响应保留给下载继续接收"""
+        metadata = self.metadata_cache.get(url)
+        if metadata and self.metadata_fresh(metadata):
+            return metadata
+
+        response = self.send_probe(url) if probe else None
+        if response is None:
+            response = self.get_session().head(url, allow_redirects=True, timeout=self.timeouts())
+            if response.status_code in (403, 405, 501) and not probe:
+                # 部分服务器不支持 HEAD，改用 Range GET 获取文件信息
+                response.close()
+                response = self.send_probe(url) or self.get_session().head(url, allow_redirects=True,
+                                                                           timeout=self.timeouts())
+        try:
+            response.raise_for_status()
+            headers = response.headers
+            content_range = re.match(r'bytes (\d+)-(\d+)/(\d+)', headers.get('Content-Range', ''))
+            if response.request.method == 'HEAD':
+                content_length = int(headers.get('Content-Length', 0))
+                supports_range = 'bytes' in headers.get('Accept-Ranges', '')
+            elif response.status_code == 206:
+                content_length = int(content_range.group(3))
+                supports_range = True
+            else:
+                # 服务器忽略了 Range，返回的是完整文件
+                content_length = int(headers.get('Content-Length', 0))
+                supports_range = False
+                self.mark_no_range(response.url)
+            metadata = {
+                "url": response.url,
+                "filename": self.get_filename(url, headers),
+                "content_length": content_length,
+                "etag": headers.get('ETag'),
+                "last_modified": headers.get('Last-Modified'),
+                "supports_range": supports_range,
+                "expires_at": signed_url_expiry(response.url),  # 签名地址的过期时间
+                "fetched_at": time.time()
+            }
+        except Exception:
+            response.close()
+            raise
+
+        if response.request.method == 'GET' and probe:
+            self.close_probe_response()
+            self.probe_response = response
+            self.probe_range = (0, int(content_range.group(2)) if content_range else content_length - 1)
+        else:
+            response.close()
+        if metadata["url"] != url:
+            self.log_message(f"重定向到: {metadata['url']}")
+        self.metadata_cache[url] = metadata
+        return metadata
+
+    def metadata_fresh(self, metadata):
+        """缓存的元数据仍在有效期内，且最终地址（签名地址）不会很快过期"""
+        deadline = metadata["fetched_at"] + self.metadata_ttl
+        if metadata["expires_at"]:
+            deadline = min(deadline, metadata["expires_at"] - self.expiry_margin)
+        return time.time() < deadline
+
+    def refresh_mirror_url(self, mirror, failed_url):
+        """最终地址返回 403/410 时重新解析源地址的重定向链，返回镜像地址是否已更新（可立即重试）"""
+        with self.resolve_lock:
+            if mirror.url != failed_url:
+                return True  # 其他线程已经更新过
+            if time.time() - mirror.refreshed_at < 10:
+                return False  # 刚解析过仍然失效，按普通失败处理
+            mirror.refreshed_at = time.time()
+            self.metadata_cache.pop(mirror.source, None)
+            try:
+                metadata = self.fetch_metadata(mirror.source)
+            except requests.RequestException as e:
+                self.log_message(f"重新解析地址失败: {mirror.source} ({str(e)})")
+                return False
+            if mirror.source == self.url:
+                self.metadata = metadata
+            mirror.url = metadata["url"]
+            self.log_message(f"下载地址已失效，重新解析为: {mirror.url}")
+            return True
+
+    def send_probe(self, url):
+        """发送探测请求：多线程时请求第一个分段，否则请求整个文件；返回可用的 206/200 响应，服务器拒绝时返回 None"""
+        end = self.segment_size - 1 if self.use_multithread else ''
+        response = self.get_session().get(url, headers={'Range': f'bytes=0-{end}'}, stream=True, allow_redirects=True,
+                                          timeout=self.timeouts())
+        if response.status_code == 200 or (response.status_code == 206 and
+                                           re.match(r'bytes 0-\d+/\d+', response.headers.get('Content-Range', ''))):
+            return response
+        response.close()
+        return None
+
+    def take_probe_response(self, start, end):
+        """取出探测请求的响应：它从 start 开始并覆盖到 end 时返回该响应，否则关闭它并返回 None"""
+        response, self.probe_response = self.probe_response, None
+        if response is not None and self.probe_range[0] == start and self.probe_range[1] >= end:
+            return response
+        if response is not None:
+            response.close()
+        return None
+
+    def close_probe_response(self):
+        """关闭未被使用的探测响应"""
+        self.take_probe_response(None, None)
+
+    @staticmethod
+    def same_validators(headers, etag, last_modified, strict=False):
+        """比较响应头与给定的强 ETag（没有时比较 Last-Modified）；strict 为 False 时响应未携带该字段视为一致"""
+        if etag and not etag.startswith('W/'):
+            name, value = 'ETag', etag
+        elif last_modified:
+            name, value = 'Last-Modified', last_modified
+        else:
+            return True
+        return headers.get(name, None if strict else value) == value
+
+    def check_validators(self, headers):
+        """数据响应的校验信息与缓存的元数据不一致时清除缓存并报错，避免拼接不同版本的文件"""
+        if self.metadata and not self.same_validators(headers, self.metadata["etag"], self.metadata["last_modified"]):
+            self.metadata_cache.pop(self.url, None)
+            raise ContentChangedError("服务器文件已变化（校验信息与缓存不一致）")
+
+    def check_link_status(self, url, status):
+        """固定使用的最终地址返回 403/410 时抛出 LinkExpiredError，由下载线程重新解析源地址"""
+        if status in (403, 410):
+            raise LinkExpiredError(f"HTTP {status}: {urlparse(url).hostname} 的下载地址已失效或签名已过期")
+
+    def check_range_response(self, url, status, headers, segment, if_range=False):
+        """校验分段响应确实从请求的位置开始（206 且 Content-Range 起点一致），服务器忽略 Range 时记录该主机并报错"""
+        if status == 206:
+            content_range = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', headers.get('Content-Range', ''))
+            if content_range and int(content_range.group(1)) == segment.pos:
+                total = content_range.group(3)
+                if self.metadata and total != '*' and int(total) != self.metadata["content_length"]:
+                    raise ContentChangedError("服务器文件大小已变化")
+                return
+        elif if_range and not (self.metadata and self.same_validators(
+                headers, self.metadata["etag"], self.metadata["last_modified"], strict=True)):
+            # If-Range 未命中：文件已变化。校验信息一致却返回 200 则是服务器忽略了 Range
+            raise ContentChangedError("服务器文件已变化")
+
+        self.mark_no_range(url)
+        raise RangeNotSupportedError(f"服务器未按请求返回分段 (状态码 {status}, "
+                                     f"Content-Range: {headers.get('Content-Range', '无')})")
+
+    def report_congestion(self, status=None, error=None):
+        """自适应连接数时，把服务器限流（429/503）和连接被重置反馈给控制器"""
+        if not self.concurrency:
+            return
+        if status in (429, 503):
+            self.concurrency.congestion(f"服务器返回 {status}")
+        elif error is not None and self.is_connection_reset(error):
+            self.concurrency.congestion("连接被重置")
+
+    @staticmethod
+    def is_connection_reset(error):
+        """沿异常链（requests/urllib3 会层层包装）查找 ConnectionResetError"""
+        seen = set()
+        while error is not None and id(error) not in seen:
+            if isinstance(error, ConnectionResetError):
+                return True
+            seen.add(id(error))
+            wrapped = [arg for arg in getattr(error, 'args', ()) if isinstance(arg, BaseException)]
+            error = error.__cause__ or error.__context__ or (wrapped[0] if wrapped else None)
+        return False
+
+    def mark_no_range(self, url):
+        """记录不支持 Range 的主机，之后对其只使用单线程下载"""
+        host = urlparse(url).hostname
+        if host not in self.no_range_hosts:
+            self.no_range_hosts.add(host)
+            self.log_message(f"服务器 {host} 不支持分段请求，之后将使用单线程下载")
+
+    def validate_mirrors(self, content_length, etag, last_modified):
+        """校验镜像与主地址内容一致（Content-Length 及 If-Range 使用的校验信息），返回可用镜像的 (源地址, 最终地址)"""
+        valid = []
+        for mirror in self.mirrors:
+            if mirror == self.url:
+                continue
+            try:
+                metadata = self.fetch_metadata(mirror)
+            except (requests.RequestException, ValueError) as e:
+                self.log_message(f"镜像不可用，已忽略: {mirror} ({str(e)})")
+                continue
+
+            headers = {'ETag': metadata["etag"], 'Last-Modified': metadata["last_modified"]}
+            consistent = (metadata["content_length"] == content_length and metadata["supports_range"]
+                          and urlparse(metadata["url"]).hostname not in self.no_range_hosts
+                          and self.same_validators(headers, etag, last_modified, strict=True))
+            if not consistent:
+                self.metadata_cache.pop(mirror, None)
+                self.log_message(f"镜像内容与主地址不一致或不支持分段下载，已忽略: {mirror}")
+            elif metadata["url"] not in [final for _, final in valid]:
+                valid.append((mirror, metadata["url"]))
+        return valid
+
     def try_delete_file(self, file_path):
         """尝试删除文件，带重试机制"""
         max_attempts = 5
@@ -214,7 +1794,8 @@ class DownloadManager:
                 if self.is_file_locked(file_path):
                     self.log_message(f"文件被占用，无法删除 (尝试 {attempt}/{max_attempts})")
                     if attempt < max_attempts:
-                        time.sleep(1)  # 等待1秒后重试
+                        if self.stop_event.wait(1):  # 等待1秒后重试（停止时立即放弃）
+                            return False
                         continue
                     else:
                         self.log_message("文件删除失败：文件被占用")
@@ -228,7 +1809,8 @@ class DownloadManager:
             except OSError as e:
                 self.log_message(f"删除失败 (尝试 {attempt}/{max_attempts}): {str(e)}")
                 if attempt < max_attempts:
-                    time.sleep(1)  # 等待1秒后重试
+                    if self.stop_event.wait(1):  # 等待1秒后重试（停止时立即放弃）
+                        return False
                 else:
                     self.log_message("文件删除失败，停止下载")
                     return False
@@ -236,122 +1818,260 @@ class DownloadManager:
         return False
 
     def download_file_singlethread(self, file_path):
-        """单线程下载文件"""
-        # 创建临时文件
+        """单线程下载文件；连接中断时立即重连，服务器支持分段时带 Range/If-Range 从已收到的位置续传"""
+        self.stall_count = 0
+        # 创建临时文件（仅流量模式不创建文件）
         temp_file = file_path.with_suffix('.part')
+        discard = self.output_mode == "discard"
+        url = self.metadata["url"] if self.metadata else self.url
+        received = 0  # 已收到的字节数，重连时从这里续传
+        failures = 0  # 连续没有收到新数据的重连次数
 
-        with requests.get(self.url, stream=True) as r:
-            r.raise_for_status()
-
-            with open(temp_file, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if self.stop_requested:
-                        break
-                    if chunk:
-                        f.write(chunk)
-                        # 更新下载进度
-                        self.update_progress(len(chunk))
+        # 任务队列中运行时占用一个全局连接名额
+        if self.connection_budget and not self.connection_budget.acquire(lambda: self.stop_requested):
+            return
+        try:
+            while not self.stop_requested:
+                offset = received
+                try:
+                    received = self.receive_singlethread(url, temp_file, received, discard)
+                    break
+                except requests.RequestException as e:
+                    received = getattr(e, 'received', received)
+                    validator = self.single_resume_validator()
+                    if self.stop_requested or not validator or not received \
+                            or isinstance(e, (ContentChangedError, RangeNotSupportedError)):
+                        raise  # 无法续传：由 download_file 退避后重新下载
+                    failures = 0 if received > offset else failures + 1
+                    if failures > self.segment_max_retries:
+                        raise
+                    delay = self.backoff_delay(failures) if failures else 0
+                    self.log_message(f"单线程下载中断: {str(e)}，"
+                                     + (f"{delay:.1f} 秒后" if delay else "立即")
+                                     + f"从 {self.format_bytes(received)} 处续传")
+                    self.stop_event.wait(delay)
+        finally:
+            if self.connection_budget:
+                self.connection_budget.release()
 
-        if not self.stop_requested:
+        if not self.stop_requested and not discard:
             # 重命名临时文件为最终文件
             self.rename_with_retry(temp_file, file_path)
 
-    def download_file_multithread(self, file_path, file_size):
-        """多线程下载文件"""
-        # 计算每个线程下载的字节范围
-        chunk_size = file_size // self.thread_count
-        ranges = []
-        for i in range(self.thread_count):
-            start = i * chunk_size
-            end = start + chunk_size - 1 if i < self.thread_count - 1 else file_size - 1
-            ranges.append((start, end))
-
-        # 创建临时文件夹
-        temp_dir = Path(self.download_path) / "temp_downloads"
-        temp_dir.mkdir(parents=True, exist_ok=True)
-
-        # 创建临时文件列表
-        temp_files = []
-        for i in range(self.thread_count):
-            temp_files.append(temp_dir / f"{file_path.stem}.part{i}")
-
-        # 清空队列并添加所有任务
-        while not self.chunk_queue.empty():
-            self.chunk_queue.get()
-        for i, (start, end) in enumerate(ranges):
-            self.chunk_queue.put((i, start, end, temp_files[i]))
-
-        # 使用线程池下载
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_count)
-        futures = []
-
-        # 提交所有任务
-        while not self.chunk_queue.empty():
-            if self.stop_requested:
-                break
-            chunk_data = self.chunk_queue.get()
-            futures.append(self.executor.submit(
-                self.download_chunk,
-                self.url,
-                *chunk_data  # 解包参数
-            ))
+    def single_resume_validator(self):
+        """单线程断线续传使用的 If-Range 取值（优先强 ETag）；服务器不支持分段或没有校验信息时返回 None"""
+        if not self.metadata or not self.metadata["supports_range"] \
+                or urlparse(self.metadata["url"]).hostname in self.no_range_hosts:
+            return None
+        etag = self.metadata["etag"]
+        if etag and not etag.startswith('W/'):
+            return etag
+        return self.metadata["last_modified"]
+
+    def receive_singlethread(self, url, temp_file, offset, discard):
+        """发送一次单线程请求并接收到结束，offset 大于 0 时从该位置续传；返回已收到的总字节数。
+        出错时异常的 received 属性记录出错前已收到的字节数"""
+        response = None
+        if offset:
+            headers = {'Range': f'bytes={offset}-', 'If-Range': self.single_resume_validator()}
+        else:
+            # 探测请求已返回完整文件时直接继续接收，省去一次请求
+            headers = {}
+            response = self.take_probe_response(0, self.download_progress["total"] - 1)
+        if response is None:
+            response = self.get_session().get(url, headers=headers, stream=True, timeout=self.timeouts())
+        received = offset
+        try:
+            with response as r:
+                r.raise_for_status()
+                content_range = re.match(r'bytes (\d+)-', r.headers.get('Content-Range', ''))
+                if offset and not (r.status_code == 206 and content_range and int(content_range.group(1)) == offset):
+                    # If-Range 未命中或服务器忽略了 Range：响应是完整文件，从头接收
+                    self.log_message("服务器返回了完整文件，从头重新下载")
+                    self.download_progress["downloaded"] -= offset
+                    received = 0
+                if self.metadata and not self.same_validators(r.headers, self.metadata["etag"],
+                                                              self.metadata["last_modified"]):
+                    # 单线程下载的是完整的新文件，只需让下一轮重新获取文件信息
+                    self.log_message("服务器文件已变化，下一轮将重新获取文件信息")
+                    self.metadata_cache.pop(self.url, None)
+
+                f = None
+                if not discard:
+                    f = open(temp_file, 'r+b' if received else 'wb')
+                    f.seek(received)
+                    f.truncate()
+                start = received
+                source, started = self.local_address(r), time.time()
+                stalls = self.stall_count
+                self.watch_connection(r, r, lambda: received, lambda: self.note_stall("单线程下载"))
+                try:
+                    for chunk in self.iter_response(r):
+                        if self.stop_requested:
+                            break
+                        if f:
+                            f.write(chunk)
+                        received += len(chunk)
+                        # 更新下载进度
+                        self.update_progress(len(chunk))
+                        self.throttle(len(chunk), r)
+                finally:
+                    self.watchdog.unwatch(r)
+                    if f:
+                        f.close()
+                    self.record_source(source, received - start, time.time() - started)
+                if self.stall_count > stalls:
+                    raise StallError(f"连接停滞，已收到 {self.format_bytes(received)}")
+
+                # 校验收到的字节数（压缩传输时解码后的大小与 Content-Length 不同，不做校验）
+                expected = int(r.headers.get('Content-Length', 0))
+                if (not self.stop_requested and expected and received - start != expected
+                        and r.headers.get('Content-Encoding', 'identity') == 'identity'):
+                    raise requests.RequestException(f"收到 {received - start} 字节，"
+                                                    f"与 Content-Length {expected} 不一致")
+        except requests.RequestException as e:
+            e.received = received
+            raise
+        return received
 
-        # 等待所有线程完成
-        for future in concurrent.futures.as_completed(futures):
-            if self.stop_requested:
-                # 在 Python 3.8 兼容的方式下取消任务
-                for f in futures:
-                    f.cancel()
-                break
-            try:
-                future.result()
-            except Exception as e:
-                self.log_message(f"下载分块失败: {str(e)}")
-                self.stop_requested = True
-                break
+    def download_file_multithread(self, file_path, file_size, journal=None):
+        """多线程下载文件"""
+        # 按固定分段大小切分文件，空闲线程会拆分慢速线程的剩余范围；续传时只切分缺失的范围
+        self.scheduler = SegmentScheduler(file_size, self.segment_size, self.min_split_size,
+                                          journal.done if journal else None, self.hedge_ratio, self.hedge_delay)
+        self.log_message(f"文件切分为 {len(self.scheduler.segments)} 个分段")
+        self.transfer_error = None
+        self.journal = journal
+        self.retries_left = self.retry_budget
+        self.stall_count = 0
+        if self.auto_connections:
+            # 上一轮学到的连接数作为本轮的起点
+            initial = self.concurrency.limit if self.concurrency else self.auto_initial_connections
+            self.concurrency = ConcurrencyController(initial, 1, self.thread_count, log=self.log_message)
+        else:
+            self.concurrency = None
+        if self.mirror_pool is None:
+            self.mirror_pool = MirrorPool([(self.url, self.metadata["url"] if self.metadata else self.url)],
+                                          self.log_message)
+
+        if self.output_mode == "discard":
+            # 仅流量模式：数据读入缓冲区后直接丢弃
+            temp_dir = None
+        elif self.output_mode == "preallocate":
+            # 预分配目标文件，各线程直接按偏移写入，无需临时文件与合并
+            self.preallocate_file(file_path, file_size)
+            temp_dir = None
+            if journal:
+                journal.save(self.scheduler.completed_ranges())
+                self.journal_saved_at = time.time()
+        else:
+            # 创建临时文件夹
+            temp_dir = Path(self.download_path) / "temp_downloads"
+            temp_dir.mkdir(parents=True, exist_ok=True)
+
+        # 探测请求的响应作为第一个分段继续接收，其余分段同时开始下载
+        probe = None
+        if self.probe_response is not None:
+            segment = self.scheduler.acquire()
+            response = self.take_probe_response(segment.pos, segment.end) if segment else None
+            if response is not None:
+                probe = (response, segment)
+            elif segment:
+                self.scheduler.requeue(segment)
+
+        if self.engine == "asyncio":
+            self.run_async_workers(file_path, temp_dir, probe)
+        else:
+            self.run_thread_workers(file_path, temp_dir, probe)
+
+        # 校验所有字节都已收到，避免把不完整的文件当作下载完成
+        if not self.transfer_stopped() and self.scheduler.completed_ranges() != [[0, file_size - 1]]:
+            missing = sum(end - start + 1 for start, end in
+                          missing_ranges(self.scheduler.completed_ranges(), file_size))
+            self.transfer_error = IOError(f"分段下载结束但缺少 {missing} 字节")
+
+        if self.scheduler.steal_count:
+            self.log_message(f"空闲线程共拆分慢速分段 {self.scheduler.steal_count} 次")
+        if self.concurrency:
+            self.log_message(f"自适应连接数: 最终 {self.concurrency.limit}, 峰值 {self.concurrency.peak}, "
+                             f"减半 {self.concurrency.decreases} 次")
+        if self.scheduler.hedge_count:
+            self.log_message(f"尾部对冲请求 {self.scheduler.hedge_count} 次, 对冲请求先完成 {self.scheduler.hedge_wins} 次, "
+                             f"重复下载浪费 {self.format_bytes(self.scheduler.hedge_wasted)}")
+        if len(self.mirror_pool.mirrors) > 1:
+            for url, nbytes, rate, errors, dropped in self.mirror_pool.summary():
+                self.log_message(f"镜像 {url}: {self.format_bytes(nbytes)}, 单连接 {self.format_bytes(rate)}/s, "
+                                 f"失败 {errors} 次{', 已剔除' if dropped else ''}")
+        if self.source_pool:
+            for address, stats in self.source_pool.stats().items():
+                self.log_message(f"源地址 {address}: 累计 {self.format_bytes(stats['bytes'])}, "
+                                 f"{stats['connections']} 个连接, 单连接 {self.format_bytes(stats['rate'])}/s")
+        for host, addresses in self.dns_cache.stats().items():
+            if len(addresses) > 1:
+                details = []
+                for address, (opened, failed, demoted) in sorted(addresses.items()):
+                    detail = f"{address}: {opened}"
+                    if failed:
+                        detail += f" (失败 {failed} 次{', 已降级' if demoted else ''})"
+                    details.append(detail)
+                self.log_message(f"{host} 各地址累计连接数: {', '.join(details)}")
+        failures = self.failure_stats()
+        if failures["segments"]:
+            self.log_message(f"分段失败次数: {failures['segments']}, 主机失败次数: {failures['hosts']}, "
+                             f"剩余重试预算: {failures['retries_left']}, 连接停滞: {failures['stalls']} 次")
+
+        segments = sorted(self.scheduler.segments, key=lambda seg: seg.start)
+        temp_files = [self.segment_file(file_path, temp_dir, seg) for seg in segments]
+        self.journal = None
+
+        if self.output_mode == "discard":
+            if self.transfer_error:
+                raise requests.RequestException(f"分段下载失败: {self.transfer_error}")
+            return
 
-        # 关闭执行器
-        if self.executor:
-            self.executor.shutdown(wait=False)
+        if isinstance(self.transfer_error, (ContentChangedError, RangeNotSupportedError)):
+            # 服务器文件已变化或不支持分段，已下载的部分作废（下一轮重新获取文件信息或改用单线程）
+            if journal:
+                journal.delete()
+            journal = None
+
+        if journal and (self.stop_requested or self.transfer_error):
+            # 保留已下载的数据和续传日志，下次只下载缺失的范围
+            journal.save(self.scheduler.completed_ranges())
+            self.log_message(f"已保存续传日志，已完成 {self.format_bytes(journal.completed_bytes())}")
+            if self.transfer_error:
+                raise requests.RequestException(f"分段下载失败: {self.transfer_error}")
+            return
 
-        if self.stop_requested:
-            # 清理临时文件
-            for temp_file in temp_files:
+        if self.stop_requested or self.transfer_error:
+            # 清理临时文件（预分配模式下为未完成的目标文件）
+            for temp_file in set(temp_files):
                 try:
                     if temp_file.exists():
                         temp_file.unlink()
                 except:
                     pass
+            if self.transfer_error:
+                raise requests.RequestException(f"分段下载失败: {self.transfer_error}")
             return
 
-        # 合并文件
-        self.log_message("开始合并文件...")
-        with open(file_path, 'wb') as outfile:
-            for i, temp_file in enumerate(temp_files):
-                if not temp_file.exists():
-                    self.log_message(f"分块文件不存在: {temp_file}")
-                    continue
-
-                try:
-                    # 检查文件是否被锁定
-                    if self.is_file_locked(temp_file):
-                        self.log_message(f"分块文件被占用: {temp_file}")
-                        continue
+        if temp_dir is None:
+            if journal:
+                journal.delete()
+            self.log_message("文件写入完成（预分配模式，无需合并）")
+            return
 
-                    with open(temp_file, 'rb') as infile:
-                        while True:
-                            chunk = infile.read(8192)
-                            if not chunk:
-                                break
-                            outfile.write(chunk)
-                except Exception as e:
-                    self.log_message(f"合并分块 {i} 时出错: {str(e)}")
+        # 合并前校验分块文件实际写入的字节数（合并目标会预分配到完整大小，合并后的文件大小无法反映缺失）
+        written = sum(temp_file.stat().st_size for temp_file in set(temp_files) if temp_file.exists())
+        if written != file_size:
+            raise requests.RequestException(f"分块文件共 {written} 字节，与 Content-Length {file_size} 不一致")
 
-                # 删除临时文件
-                try:
-                    temp_file.unlink()
-                except:
-                    pass
+        # 合并文件：各分块并行拷贝到目标文件的对应偏移
+        self.log_message("开始合并文件...")
+        merge_start = time.time()
+        methods = self.merge_parts(file_path, file_size,
+                                   [(temp_file, seg.start) for seg, temp_file in zip(segments, temp_files)])
+        merge_time = time.time() - merge_start
 
         # 删除临时文件夹
         try:
@@ -359,30 +2079,668 @@ class DownloadManager:
         except:
             pass
 
+        used = ", ".join(sorted(set(method for method in methods if method)))
+        self.log_message(f"合并方式: {used or '无'}, 耗时: {merge_time:.2f}秒")
         self.log_message("文件合并完成")
 
-    def download_chunk(self, url, chunk_index, start, end, temp_file):
+    def run_thread_workers(self, file_path, temp_dir, probe=None):
+        """在线程池中运行分段下载线程；probe 为 (探测响应, 第一个分段)，由其中一个线程接收；
+        自适应连接数时每个采样周期按控制器的目标补充线程"""
+        # 使用线程池下载：各轮复用同一个线程池，线程数调大时才重建（任务队列中运行时使用共享线程池）
+        if self.shared_executor:
+            self.executor = self.shared_executor
+        elif self.executor is None or self.executor._max_workers < self.thread_count:
+            if self.executor:
+                self.executor.shutdown(wait=False)
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.thread_count)
+        futures = set()
+        if probe:
+            futures.add(self.executor.submit(self.download_probe_worker, *probe, file_path, temp_dir))
+
+        # 每个线程循环领取分段
+        for _ in range(self.initial_workers() - len(futures)):
+            if self.stop_requested:
+                break
+            futures.add(self.executor.submit(self.download_worker, file_path, temp_dir))
+
+        # 等待所有线程完成
+        timeout = self.concurrency.interval if self.concurrency else None
+        while futures:
+            done, futures = concurrent.futures.wait(futures, timeout, concurrent.futures.FIRST_COMPLETED)
+            if self.stop_requested:
+                break
+            error = next((future.exception() for future in done if future.exception()), None)
+            if error:
+                self.log_message(f"下载分块失败: {str(error)}")
+                self.transfer_error = error  # 通知其他线程停止本轮传输
+                break
+            for _ in range(self.workers_to_add(len(futures))):
+                futures.add(self.executor.submit(self.download_worker, file_path, temp_dir))
+
+        if futures:
+            # 停止或出错：取消未开始的线程，中断仍在传输的连接，等所有线程退出后再清理或开始下一轮
+            for future in futures:
+                future.cancel()
+            self.abort_connections()
+            concurrent.futures.wait(futures)
+
+    def run_async_workers(self, file_path, temp_dir, probe=None):
+        """在共享事件循环上运行分段下载协程；探测响应是同步连接，由当前线程接收，之后等待协程全部结束"""
+        self.async_future = AsyncEngine.shared().submit(self.download_segments_async(file_path, temp_dir))
+        try:
+            if probe:
+                try:
+                    self.download_probe_worker(*probe, file_path, temp_dir, keep_working=False)
+                except Exception as e:
+                    self.log_message(f"下载分块失败: {str(e)}")
+                    self.transfer_error = e  # 通知各协程停止本轮传输
+            self.async_future.result()
+        except concurrent.futures.CancelledError:
+            self.stop_requested = True
+        except Exception as e:
+            self.log_message(f"下载分块失败: {str(e)}")
+            self.transfer_error = e
+        finally:
+            self.async_future = None
+
+    async def download_segments_async(self, file_path, temp_dir):
+        """协程版下载：thread_count 个协程循环领取分段（自适应连接数时按控制器的目标增减）；
+        停止时本任务在事件循环上被取消，等所有协程退出后才结束"""
+        if self.async_client is None:
+            self.async_client = AsyncHTTPClient(self.dns_cache, self.source_pool)
+        self.async_client.timeouts = self.timeouts()
+        self.async_task = asyncio.current_task()
+        tasks = {asyncio.ensure_future(self.download_worker_async(file_path, temp_dir))
+                 for _ in range(self.initial_workers())}
+        timeout = self.concurrency.interval if self.concurrency else None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                errors = [task.exception() for task in done if not task.cancelled() and task.exception()]
+                if errors:
+                    self.transfer_error = errors[0]
+                    self.abort_connections()  # 同时中断当前线程中接收的探测响应
+                    raise errors[0]  # 任一协程出错时结束本轮（同时出错的其他异常也已取出）
+                for _ in range(self.workers_to_add(len(tasks))):
+                    tasks.add(asyncio.ensure_future(self.download_worker_async(file_path, temp_dir)))
+        finally:
+            self.async_task = None
+            for task in tasks:
+                task.cancel()
+            # 等待被取消的协程执行完清理（关闭文件和连接），同时取出它们的异常
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def initial_workers(self):
+        """开始时启动的连接数：固定为 thread_count，自适应时为控制器的当前目标"""
+        return self.concurrency.limit if self.concurrency else self.thread_count
+
+    def workers_to_add(self, running):
+        """自适应连接数时按采样结果返回需要新增的连接数（没有可领取或可拆分的分段时不新增）"""
+        if not self.concurrency or self.transfer_stopped():
+            return 0
+        target = self.concurrency.update(self.total_downloaded, running)
+        return max(0, target - running) if self.scheduler.has_work() else 0
+
+    async def download_worker_async(self, file_path, temp_dir):
+        """下载协程：循环领取分段，直到没有可下载或可拆分的范围（自适应连接数超过目标时提前退出）"""
+        parking = object()  # 在调度器中等待对冲时的标识
+        while not self.transfer_stopped():
+            if self.concurrency and self.concurrency.retire():
+                return
+            segment = self.scheduler.acquire()
+            if segment is None:
+                wait = self.scheduler.retry_wait(parking)
+                if wait is None:
+                    return
+                await asyncio.sleep(min(wait, 0.2))  # 等待退避中的分段
+                continue
+            if self.connection_budget and not await self.connection_budget.acquire_async(self.transfer_stopped):
+                self.scheduler.requeue(segment)
+                return
+            mirror = self.mirror_pool.choose()
+            url, pos, started = mirror.url, segment.pos, time.time()
+            try:
+                await self.download_chunk_async(url, segment, self.segment_file(file_path, temp_dir, segment))
+                self.mirror_pool.release(mirror, segment.pos - pos, time.time() - started)
+            except asyncio.CancelledError:
+                self.mirror_pool.release(mirror, segment.pos - pos, time.time() - started)
+                raise
+            except Exception as e:
+                expired = isinstance(e, LinkExpiredError)
+                stopped = self.transfer_stopped()  # 停止或本轮出错时连接被主动中断
+                cancelled = segment.owner.done or stopped  # 对冲中落后的一方被中断
+                self.mirror_pool.release(mirror, segment.pos - pos, time.time() - started,
+                                         failed=not expired and not cancelled)
+                if not cancelled:
+                    self.report_congestion(error=e)
+                if stopped:
+                    return
+                if self.scheduler.detach(segment):
+                    pass  # 对冲的另一方已完成或仍在下载，无需重试
+                elif expired and await asyncio.get_running_loop().run_in_executor(
+                        None, self.refresh_mirror_url, mirror, url):
+                    self.scheduler.requeue(segment)  # 地址已更新，立即重试，不计入失败次数
+                else:
+                    self.retry_segment(url, segment, e)
+            finally:
+                if self.connection_budget:
+                    self.connection_budget.release()
+
+    async def download_chunk_async(self, url, segment, temp_file):
+        """协程版分块下载"""
+        headers = self.segment_headers(segment)
+        response = None
+
+        try:
+            response = await self.async_client.get(url, headers=headers)
+            segment.response = response
+            self.report_congestion(status=response.status)
+            self.check_link_status(url, response.status)
+            response.raise_for_status()
+            response_headers = requests.structures.CaseInsensitiveDict(response.headers)
+            self.check_range_response(url, response.status, response_headers, segment, 'If-Range' in headers)
+            self.check_validators(response_headers)
+
+            source, pos, started = response.local_address(), segment.pos, time.time()
+            self.watch_connection(segment, response, lambda: segment.pos, lambda: self.segment_stalled(segment))
+            fd, base = self.open_segment_file(segment, temp_file)
+            writing = None  # 线程池中进行的写入
+            try:
+                while not self.transfer_stopped():
+                    chunk = await response.read(self.buffer_size or 1024 * 1024)
+                    if not chunk:
+                        break
+                    await self.throttle_async(len(chunk), segment)
+                    if fd is None:
+                        more = self.write_segment_data(fd, base, segment, chunk)  # 仅流量模式只记录进度
+                    else:
+                        # 写文件和定期保存续传日志（fsync）放到线程池，不阻塞共享的事件循环
+                        writing = asyncio.get_running_loop().run_in_executor(
+                            None, self.write_segment_data, fd, base, segment, chunk)
+                        more = await asyncio.shield(writing)
+                    if not more:
+                        break
+            finally:
+                if writing is not None and not writing.done():
+                    # 协程被取消时写入仍在线程池中进行，等它结束后才能关闭文件描述符
+                    await asyncio.gather(writing, return_exceptions=True)
+                self.watchdog.unwatch(segment)
+                if fd is not None:
+                    os.close(fd)
+                self.record_source(source, segment.pos - pos, time.time() - started)
+            if self.transfer_stopped():
+                return
+            self.finish_segment(segment)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not segment.owner.done and not segment.stalled and not self.transfer_stopped():
+                self.log_message(f"分块 {segment.index} 下载失败: {str(e)}")
+            raise
+        finally:
+            segment.response = None
+            if response is not None:
+                response.release()
+
+    @staticmethod
+    def segment_file(file_path, temp_dir, segment):
+        """返回分段写入的目标文件：预分配模式为目标文件本身，否则为对应的分块临时文件"""
+        if temp_dir is None:
+            return file_path
+        return temp_dir / f"{file_path.stem}.part{segment.index}"
+
+    def download_worker(self, file_path, temp_dir):
+        """下载线程：循环领取分段，直到没有可下载或可拆分的范围（自适应连接数超过目标时提前退出）"""
+        parking = object()  # 在调度器中等待对冲时的标识
+        while not self.transfer_stopped():
+            if self.concurrency and self.concurrency.retire():
+                return
+            segment = self.scheduler.acquire()
+            if segment is None:
+                wait = self.scheduler.retry_wait(parking)
+                if wait is None:
+                    return
+                self.stop_event.wait(min(wait, 0.2))  # 等待退避中的分段（停止时立即返回）
+                continue
+            if self.connection_budget and not self.connection_budget.acquire(self.transfer_stopped):
+                self.scheduler.requeue(segment)
+                return
+            mirror = self.mirror_pool.choose()
+            url, pos, started = mirror.url, segment.pos, time.time()
+            try:
+                self.download_chunk(url, segment, self.segment_file(file_path, temp_dir, segment))
+                self.mirror_pool.release(mirror, segment.pos - pos, time.time() - started)
+            except Exception as e:
+                expired = isinstance(e, LinkExpiredError)
+                stopped = self.transfer_stopped()  # 停止或本轮出错时连接被主动中断
+                cancelled = segment.owner.done or stopped  # 对冲中落后的一方被中断
+                self.mirror_pool.release(mirror, segment.pos - pos, time.time() - started,
+                                         failed=not expired and not cancelled)
+                if not cancelled:
+                    self.report_congestion(error=e)
+                if stopped:
+                    return
+                if self.scheduler.detach(segment):
+                    pass  # 对冲的另一方已完成或仍在下载，无需重试
+                elif expired and self.refresh_mirror_url(mirror, url):
+                    self.scheduler.requeue(segment)  # 地址已更新，立即重试，不计入失败次数
+                else:
+                    self.retry_segment(url, segment, e)
+            finally:
+                if self.connection_budget:
+                    self.connection_budget.release()
+
+    def download_probe_worker(self, response, segment, file_path, temp_dir, keep_working=True):
+        """接收探测响应作为第一个分段，之后（keep_working 为 True 或该分段失败时）作为普通下载线程继续领取分段"""
+        try:
+            with response:
+                self.receive_chunk(response, segment, self.segment_file(file_path, temp_dir, segment))
+        except Exception as e:
+            if self.transfer_stopped():
+                return  # 停止或本轮出错时连接被主动中断
+            if not segment.owner.done:
+                self.log_message(f"分块 {segment.index} 下载失败: {str(e)}")
+            if not self.scheduler.detach(segment):
+                self.retry_segment(response.url, segment, e)
+                keep_working = True  # 重新排队的分段可能已没有其他线程领取
+        if keep_working:
+            self.download_worker(file_path, temp_dir)
+
+    def download_chunk(self, url, segment, temp_file):
         """下载文件分块"""
-        headers = {'Range': f'bytes={start}-{end}'}
+        headers = self.segment_headers(segment)
 
         try:
-            with requests.get(url, headers=headers, stream=True) as r:
+            with self.session.get(url, headers=headers, stream=True, timeout=self.timeouts()) as r:
+                self.report_congestion(status=r.status_code)
+                self.check_link_status(url, r.status_code)
                 r.raise_for_status()
-
-                with open(temp_file, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if self.stop_requested:
-                            return
-                        if chunk:
-                            f.write(chunk)
-                            with self.lock:
-                                self.update_progress(len(chunk))
+                self.check_range_response(url, r.status_code, r.headers, segment, 'If-Range' in headers)
+                self.check_validators(r.headers)
+                self.receive_chunk(r, segment, temp_file)
         except Exception as e:
-            self.log_message(f"分块 {chunk_index} 下载失败: {str(e)}")
-            # 将失败的任务重新加入队列
-            self.chunk_queue.put((chunk_index, start, end, temp_file))
+            if not segment.owner.done and not segment.stalled and not self.transfer_stopped():
+                self.log_message(f"分块 {segment.index} 下载失败: {str(e)}")
             raise
 
+    def receive_chunk(self, response, segment, temp_file):
+        """把分段响应体写入分段，接收完整后标记分段完成"""
+        source, pos, started = self.local_address(response), segment.pos, time.time()
+        segment.response = response
+        self.watch_connection(segment, response, lambda: segment.pos, lambda: self.segment_stalled(segment))
+        fd, base = self.open_segment_file(segment, temp_file)
+        try:
+            for chunk in self.iter_response(response):
+                if self.transfer_stopped():
+                    return
+                self.throttle(len(chunk), segment)
+                if not self.write_segment_data(fd, base, segment, chunk):
+                    break  # 分段已完成或后半部分已被其他线程接管
+        finally:
+            self.watchdog.unwatch(segment)
+            segment.response = None
+            if fd is not None:
+                os.close(fd)
+            self.record_source(source, segment.pos - pos, time.time() - started)
+        self.finish_segment(segment)
+
+    def abort_connections(self):
+        """中断本任务所有连接上阻塞中的请求和读取（停止或本轮出错时调用）"""
+        if self.adapter:
+            self.adapter.abort_connections()
+
+    def timeouts(self):
+        """requests 使用的 (连接超时, 读取超时)"""
+        return self.connect_timeout, self.read_timeout
+
+    def watch_connection(self, key, response, progress, on_stall):
+        """登记正在接收的连接，由看门狗检测停滞"""
+        if self.stall_time > 0:
+            self.watchdog.floor, self.watchdog.stall_time = self.stall_speed, self.stall_time
+            self.watchdog.watch(key, response, progress, on_stall)
+
+    def segment_stalled(self, segment):
+        segment.stalled = True
+        self.note_stall(f"分块 {segment.index}")
+
+    def note_stall(self, name):
+        """记录一次连接停滞（看门狗线程调用，随后断开该连接）"""
+        with self.lock:
+            self.stall_count += 1
+        self.log_message(f"{name} 连接停滞: 连续 {self.stall_time} 秒低于 "
+                         f"{self.format_bytes(self.stall_speed)}/s，断开重连")
+
+    def finish_segment(self, segment):
+        """连接接收结束后校验分段已收全并标记完成；处于对冲中时中断落后一方的连接"""
+        owner = segment.owner
+        if owner.done:
+            return  # 对冲的另一方已先完成
+        if segment.stalled:
+            raise StallError(f"连接停滞，从偏移 {owner.written} 处续传")
+        if owner.written <= owner.end:
+            raise IOError(f"连接提前关闭，缺少 {owner.end - owner.written + 1} 字节")
+        self.abort_attempt(self.scheduler.complete(segment))
+
+    @staticmethod
+    def abort_attempt(segment):
+        """中断分段当前连接上阻塞中的读取，使落后的一方立即退出"""
+        response = segment.response if segment else None
+        if response is not None:
+            abort_response(response)
+
+    @staticmethod
+    def local_address(response):
+        """返回响应所用连接的本地地址（须在响应体读完、连接归还前调用）"""
+        try:
+            return response.raw._connection.sock.getsockname()[0]
+        except (AttributeError, OSError):
+            return None
+
+    def record_source(self, source, nbytes, elapsed):
+        """配置了源地址时按连接的本地地址统计流量"""
+        if self.source_pool and source and nbytes > 0:
+            self.source_pool.record(source, nbytes, elapsed)
+
+    def iter_response(self, response):
+        """把响应体直接读入可复用的缓冲区，逐次产出已填充部分的 memoryview（使用者须在下次迭代前用完）"""
+        fp = getattr(response.raw, '_fp', None)
+        encoding = response.headers.get('Content-Encoding', 'identity').lower()
+        if fp is None or not hasattr(fp, 'readinto') or encoding not in ('', 'identity'):
+            # 有内容编码时需要 urllib3 解码，退回普通读取
+            for chunk in response.iter_content(chunk_size=self.buffer_size or 256 * 1024):
+                if chunk:
+                    yield chunk
+            return
+
+        min_size, max_size = 256 * 1024, 4 * 1024 * 1024
+        size = self.buffer_size or min_size
+        view = self.read_buffer(self.buffer_size or max_size)
+        while True:
+            started = time.time()
+            try:
+                count = fp.readinto(view[:size])
+            except OSError as e:
+                # 读取超时或连接被中断：与 requests 的其他网络错误一样按 RequestException 处理
+                raise requests.ConnectionError(f"读取响应体失败: {e}") from e
+            if not count:
+                break
+            if fp.isclosed():
+                # 响应体已读完，连接立即归还连接池以便复用
+                response.raw.release_conn()
+            yield view[:count]
+
+            if not self.buffer_size and count == size:
+                # 自动调整：填满缓冲区太快则加倍，太慢则减半，使每次读取约 50-250 毫秒
+                elapsed = time.time() - started
+                if elapsed < 0.05 and size < max_size:
+                    size *= 2
+                elif elapsed > 0.25 and size > min_size:
+                    size //= 2
+
+        response.raw.release_conn()
+
+    @classmethod
+    def read_buffer(cls, size):
+        """返回当前线程复用的接收缓冲区（至少 size 字节），只在首次使用或需要更大时分配"""
+        view = getattr(cls._read_buffers, 'view', None)
+        if view is None or len(view) < size:
+            view = cls._read_buffers.view = memoryview(bytearray(size))
+        return view
+
+    def set_rate_limit(self, mbps):
+        """设置本任务目标速率（Mbps），0 为不限速，下载过程中可随时调整"""
+        self.rate_limit_mbps = max(0, mbps)
+        self.rate_limiter.set_rate(self.rate_limit_mbps * 125000)
+
+    def throttle_delay(self, nbytes):
+        """按本任务和全局限速器扣减令牌，返回需要等待的秒数"""
+        delay = self.rate_limiter.reserve(nbytes)
+        if self.global_limiter:
+            delay = max(delay, self.global_limiter.reserve(nbytes))
+        return delay
+
+    def throttle(self, nbytes, key=None):
+        """限速等待，等待期间可被停止打断；key 为看门狗登记的连接，等待时间不计入停滞检测"""
+        delay = self.throttle_delay(nbytes)
+        if delay <= 0:
+            return
+        deadline = time.monotonic() + delay
+        self.watchdog.pause(key)
+        try:
+            while not self.transfer_stopped():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.stop_event.wait(min(remaining, 0.1))
+        finally:
+            self.watchdog.resume(key)
+
+    async def throttle_async(self, nbytes, key=None):
+        """协程版限速等待"""
+        delay = self.throttle_delay(nbytes)
+        if delay > 0:
+            self.watchdog.pause(key)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self.watchdog.resume(key)
+
+    def retry_segment(self, url, segment, error):
+        """记录分段失败，按指数退避加随机抖动重新排队；超出重试次数或预算时抛出异常"""
+        host = urlparse(url).hostname
+        segment = segment.owner
+        with self.lock:
+            segment.failures += 1
+            self.host_failures[host] += 1
+            self.retries_left -= 1
+            give_up = (isinstance(error, (ContentChangedError, RangeNotSupportedError))
+                       or segment.failures > self.segment_max_retries
+                       or self.retries_left < 0)
+
+        if give_up:
+            self.scheduler.requeue(segment)
+            raise error
+
+        delay = self.backoff_delay(segment.failures)
+        self.scheduler.requeue(segment, delay)
+        self.log_message(f"分块 {segment.index} 将在 {delay:.1f} 秒后从偏移 {segment.written} 处重试 "
+                         f"(第 {segment.failures}/{self.segment_max_retries} 次)")
+
+    def backoff_delay(self, failures):
+        """第 failures 次连续失败后的重试等待时间：指数退避加随机抖动"""
+        delay = min(self.retry_max_delay, self.retry_base_delay * 2 ** (failures - 1))
+        return random.uniform(delay / 2, delay)
+
+    def failure_stats(self):
+        """返回分段失败统计：各分段失败次数、各主机失败次数、本轮剩余重试预算"""
+        segments = {}
+        if self.scheduler:
+            segments = {seg.index: seg.failures for seg in self.scheduler.segments if seg.failures}
+        return {
+            "segments": segments,
+            "hosts": dict(self.host_failures),
+            "retries_left": max(0, self.retries_left),
+            "stalls": self.stall_count
+        }
+
+    def transfer_stopped(self):
+        """用户停止或本轮传输出错时，各下载线程应尽快退出"""
+        return self.stop_requested or self.transfer_error is not None
+
+    def segment_headers(self, segment):
+        """分段请求头：Range，续传时附带 If-Range 防止拼接不同版本的文件"""
+        headers = {'Range': f'bytes={segment.pos}-{segment.end}'}
+        if self.journal and self.journal.if_range():
+            headers['If-Range'] = self.journal.if_range()
+        return headers
+
+    def open_segment_file(self, segment, temp_file):
+        """打开分段的写入目标，返回 (文件描述符, 文件内偏移基准)；仅流量模式返回 (None, 0)"""
+        if self.output_mode == "discard":
+            return None, 0
+        if self.output_mode == "preallocate":
+            # 每个连接持有独立的文件描述符，按偏移定位写入
+            return os.open(temp_file, os.O_RDWR | getattr(os, 'O_BINARY', 0)), 0
+
+        # 分块临时文件从已写入位置继续追加（对冲请求写入原分段的临时文件，不截断）
+        fd = os.open(temp_file, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        if segment.primary is None:
+            os.ftruncate(fd, segment.written - segment.start)
+        return fd, segment.owner.start
+
+    def write_segment_data(self, fd, base, segment, data):
+        """把收到的数据写入分段（跳过对冲中另一方已领取的重复部分），返回该分段是否还需要继续接收"""
+        offset, length, duplicate = self.scheduler.reserve(segment, len(data))
+        if length > duplicate:
+            if fd is not None:
+                self.write_at(fd, data[duplicate:length], offset + duplicate - base)
+            owner = segment.owner
+            with self.lock:
+                owner.written = max(owner.written, offset + length)
+                self.update_progress(length - duplicate)
+            if self.journal:
+                self.save_journal_periodically()
+        return length == len(data) and segment.remaining > 0 and not segment.owner.done
+
+    def save_journal_periodically(self):
+        """按间隔保存续传日志，多个线程同时到期时只由一个线程写入"""
+        journal = self.journal
+        now = time.time()
+        with self.lock:
+            if journal is None or now - self.journal_saved_at < self.journal_interval:
+                return
+            self.journal_saved_at = now
+        journal.save(self.scheduler.completed_ranges())
+
+    def merge_parts(self, file_path, file_size, parts):
+        """把分块文件并行合并到预分配目标文件的对应偏移，返回每个分块使用的拷贝方式；
+        全部成功后才删除分块文件，任一分块失败时删除未完成的目标文件、保留分块并抛出异常"""
+        self.preallocate_file(file_path, file_size)
+        workers = max(1, min(self.merge_workers, len(parts)))
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                methods = list(executor.map(lambda part: self.merge_part(file_path, *part), parts))
+        except Exception:
+            try:
+                file_path.unlink()  # 目标文件已预分配到完整大小，留下会被当作下载完成的文件
+            except OSError:
+                pass
+            raise
+
+        # 删除临时文件
+        for temp_file, _ in parts:
+            try:
+                temp_file.unlink()
+            except OSError:
+                pass
+        return methods
+
+    def merge_part(self, file_path, temp_file, offset):
+        """合并单个分块文件，返回使用的拷贝方式；分块缺失、被占用或拷贝出错时抛出异常，本轮下载失败"""
+        if not temp_file.exists():
+            raise requests.RequestException(f"分块文件不存在: {temp_file}")
+
+        # 检查文件是否被锁定
+        if self.is_file_locked(temp_file):
+            raise requests.RequestException(f"分块文件被占用: {temp_file}")
+
+        try:
+            src_fd = os.open(temp_file, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            try:
+                dst_fd = os.open(file_path, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+                try:
+                    return self.copy_range(src_fd, dst_fd, offset, os.fstat(src_fd).st_size)
+                finally:
+                    os.close(dst_fd)
+            finally:
+                os.close(src_fd)
+        except OSError as e:
+            raise requests.RequestException(f"合并分块 {temp_file.name} 时出错: {str(e)}") from e
+
+    @staticmethod
+    def copy_range(src_fd, dst_fd, dst_offset, length, batch_size=64 * 1024 * 1024):
+        """把源文件全部内容拷贝到目标文件的指定偏移，依次尝试 reflink、copy_file_range、sendfile，最后用缓冲区拷贝"""
+        if length <= 0:
+            return "empty"
+
+        # reflink 克隆（btrfs/xfs 等支持时只修改元数据，不拷贝数据）
+        if sys.platform.startswith('linux'):
+            try:
+                import fcntl
+                import struct
+                FICLONERANGE = 0x4020940d
+                fcntl.ioctl(dst_fd, FICLONERANGE, struct.pack('qQQQ', src_fd, 0, length, dst_offset))
+                return "reflink"
+            except (ImportError, OSError):
+                pass
+
+        copied = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while copied < length:
+                    count = os.copy_file_range(src_fd, dst_fd, min(batch_size, length - copied),
+                                               copied, dst_offset + copied)
+                    if count == 0:
+                        break
+                    copied += count
+                if copied == length:
+                    return "copy_file_range"
+            except OSError:
+                pass  # 跨文件系统或不支持时退回 sendfile
+
+        if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+            try:
+                os.lseek(dst_fd, dst_offset + copied, os.SEEK_SET)
+                while copied < length:
+                    count = os.sendfile(dst_fd, src_fd, copied, min(batch_size, length - copied))
+                    if count == 0:
+                        break
+                    copied += count
+                if copied == length:
+                    return "sendfile"
+            except OSError:
+                pass
+
+        # 通用方式：复用同一块大缓冲区读入后定位写出
+        buffer = bytearray(4 * 1024 * 1024)
+        view = memoryview(buffer)
+        os.lseek(src_fd, copied, os.SEEK_SET)
+        with open(src_fd, 'rb', buffering=0, closefd=False) as src:
+            while copied < length:
+                count = src.readinto(view[:min(len(buffer), length - copied)])
+                if not count:
+                    break
+                DownloadManager.write_at(dst_fd, view[:count], dst_offset + copied)
+                copied += count
+        return "buffer"
+
+    @staticmethod
+    def preallocate_file(file_path, size):
+        """预分配文件空间（优先使用fallocate，不支持时退回ftruncate）"""
+        fd = os.open(file_path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            os.ftruncate(fd, size)
+            if size > 0 and hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    pass  # 文件系统不支持时保留ftruncate的结果
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def write_at(fd, data, offset):
+        """在指定偏移处写入数据（支持pwrite时使用定位写）"""
+        view = memoryview(data)
+        while view:
+            if hasattr(os, 'pwrite'):
+                written = os.pwrite(fd, view, offset)
+            else:
+                os.lseek(fd, offset, os.SEEK_SET)
+                written = os.write(fd, view)
+            view = view[written:]
+            offset += written
+
     def rename_with_retry(self, src, dst, max_retries=5, retry_delay=1):
         """重命名文件，带重试机制解决文件占用问题"""
         for i in range(max_retries):
@@ -393,7 +2751,8 @@ class DownloadManager:
             except (PermissionError, OSError) as e:
                 if i < max_retries - 1:
                     self.log_message(f"文件占用，等待重试 ({i + 1}/{max_retries})...")
-                    time.sleep(retry_delay)
+                    if self.stop_event.wait(retry_delay):  # 停止时保留临时文件，不再重试
+                        return False
                 else:
                     # 最后一次尝试
                     try:
@@ -426,6 +2785,7 @@ class DownloadManager:
         """更新下载进度信息"""
         # 更新下载量
         self.download_progress["downloaded"] += chunk_size
+        self.total_downloaded += chunk_size
 
         # 计算百分比
         if self.download_progress["total"] > 0:
@@ -442,6 +2802,22 @@ class DownloadManager:
             self.last_downloaded = self.download_progress["downloaded"]
             self.last_update_time = now
 
+            # 多镜像下载时附带各镜像速度
+            if self.mirror_pool and len(self.mirror_pool.mirrors) > 1:
+                self.download_progress["mirrors"] = self.mirror_pool.speeds()
+            # 多源地址时附带各源地址的累计流量
+            if self.source_pool:
+                self.download_progress["sources"] = self.source_pool.stats()
+            # 自适应连接数时附带当前目标连接数
+            if self.concurrency:
+                self.download_progress["connections"] = self.concurrency.limit
+            # 本轮因停滞断开重连的连接数
+            if self.stall_count:
+                self.download_progress["stalls"] = self.stall_count
+            # 尾部对冲时附带重复下载浪费的字节数
+            if self.scheduler and self.scheduler.hedge_count:
+                self.download_progress["hedge_wasted"] = self.scheduler.hedge_wasted
+
             # 更新GUI进度
             if self.gui_callback:
                 self.gui_callback("progress_update", self.download_progress)
@@ -458,34 +2834,19 @@ class DownloadManager:
         size_value = round(size_bytes / divisor, 2)
         return f"{size_value} {size_units[exponent]}"
 
-    def schedule_file_deletion(self, file_path):
-        """安排文件删除任务"""
-        if self.delete_timer and self.delete_timer.is_alive():
-            self.delete_timer.cancel()
-
-        self.delete_timer = threading.Timer(self.delete_time, self.delete_and_restart, [file_path])
-        self.delete_timer.daemon = True
-        self.delete_timer.start()
-
-        # 显示等待进度
-        self.show_progress(self.delete_time)
-
     def show_progress(self, seconds):
-        """显示点状进度动画"""
+        """等待删除时间并每 10 秒显示剩余时间，返回是否等满（停止时立即返回 False）"""
         self.log_message(f"\n等待删除 ({seconds}秒):")
-        for i in range(seconds):
-            if self.stop_requested:
+        for elapsed in range(0, seconds, 10):
+            self.log_message(f"\n剩余时间: {seconds - elapsed}秒")
+            if self.stop_event.wait(min(10, seconds - elapsed)):
                 self.log_message("\n等待已取消")
-                return
-            # 每10秒显示一次剩余时间
-            if i % 10 == 0:
-                remaining = seconds - i
-                self.log_message(f"\n剩余时间: {remaining}秒")
-            time.sleep(1)
+                return False
         self.log_message("\n")
+        return True
 
-    def delete_and_restart(self, file_path):
-        """删除文件并重启下载"""
+    def delete_finished_file(self, file_path):
+        """删除本轮下载完成的文件，返回是否继续下一轮（文件被占用时下一轮会再次尝试删除）"""
         try:
             if file_path.exists():
                 # 检查文件是否被占用
@@ -495,26 +2856,21 @@ class DownloadManager:
                 else:
                     file_path.unlink()
                     self.log_message(f"\n文件已删除: {file_path}")
-
-            # 重置停止请求标志
-            self.stop_requested = False
-
-            # 标记正在重启
-            self.is_restarting = True
-
-            # 重新开始下载
-            self.start_download()
+            return True
         except OSError as e:
             self.log_message(f"\n删除文件时出错: {str(e)}")
-            self.active = False
+            return False
 
     def start_download(self):
-        """启动下载线程"""
+        """启动下载线程，返回是否已启动；上一个下载线程未能在限定时间内退出时不启动，避免两个循环共用下载状态"""
         # 如果已有下载线程在运行，先停止它
         if self.download_thread and self.download_thread.is_alive():
             self.log_message("停止当前下载任务...")
             self.stop_download()
-            time.sleep(1)  # 等待线程停止
+            self.download_thread.join(5)  # 等待线程停止（连接已被中断，通常立即结束）
+            if self.download_thread.is_alive():
+                self.log_message("上一个下载线程仍未退出，暂不启动新的下载，请稍后重试")
+                return False
 
         # 通知GUI下载开始
         if self.gui_callback:
@@ -524,20 +2880,20 @@ class DownloadManager:
         self.download_thread = threading.Thread(target=self.download_file, daemon=True)
         self.download_thread.start()
         self.log_message("下载任务已启动")
+        return True
 
     def stop_download(self):
         """停止所有下载和删除任务"""
         self.stop_requested = True
         self.is_restarting = False  # 重置重启标志
-        if self.delete_timer and self.delete_timer.is_alive():
-            self.delete_timer.cancel()
 
-        # 关闭线程池执行器（如果存在）
-        if self.executor:
-            try:
-                self.executor.shutdown(wait=False)
-            except:
-                pass
+        # 中断正在进行的请求和读取，阻塞中的下载线程立即返回
+        self.abort_connections()
+
+        # 在事件循环上取消asyncio下载任务（如果存在），其协程会立即收到取消
+        task = self.async_task
+        if task is not None:
+            AsyncEngine.shared().loop.call_soon_threadsafe(task.cancel)
 
         self.log_message("\n操作已停止")
 
@@ -547,6 +2903,298 @@ class DownloadManager:
             self.gui_callback("log", message)
 
 
+class DownloadJobQueue:
+    """多任务下载队列：多个（可循环的）下载任务共享一个工作线程池和全局连接预算"""
+
+    def __init__(self, max_connections=64, gui_callback=None, global_rate_mbps=0):
+        self.max_connections = max_connections
+        self.connection_budget = ConnectionBudget(max_connections)
+        self.global_limiter = TokenBucket(global_rate_mbps * 125000)  # 所有任务共享的全局限速器
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_connections)
+        self.gui_callback = gui_callback
+        self.jobs = {}  # 任务编号 -> DownloadManager
+        self.next_job_id = 1
+        self.lock = threading.Lock()
+        self.last_sample = (time.time(), 0)  # 上次统计汇总速度时的 (时间, 累计字节)
+
+    def add_job(self, url, download_path, delete_time=0, thread_count=4, rate_limit_mbps=0, **options):
+        """添加任务，返回任务编号；options 为 DownloadManager 的其他属性（如 output_mode、engine、mirrors）"""
+        with self.lock:
+            job_id = self.next_job_id
+            self.next_job_id += 1
+
+        manager = DownloadManager(gui_callback=self.job_callback(job_id))
+        manager.url = url
+        manager.download_path = download_path
+        manager.delete_time = delete_time
+        manager.thread_count = thread_count
+        manager.use_multithread = thread_count > 1
+        for name, value in options.items():
+            if not hasattr(manager, name):
+                raise AttributeError(f"未知的任务选项: {name}")
+            setattr(manager, name, value)
+        manager.shared_executor = self.executor
+        manager.connection_budget = self.connection_budget
+        manager.global_limiter = self.global_limiter
+        manager.set_rate_limit(rate_limit_mbps)
+
+        with self.lock:
+            self.jobs[job_id] = manager
+        return job_id
+
+    def job_callback(self, job_id):
+        """把任务的回调转发给队列回调，日志加上任务编号"""
+        def callback(event_type, data):
+            if not self.gui_callback:
+                return None
+            if event_type == "log":
+                return self.gui_callback("log", f"[任务 {job_id}] {data}")
+            return self.gui_callback(event_type, (job_id, data))
+        return callback
+
+    def start(self, job_id=None):
+        """启动指定任务，未指定时启动全部任务"""
+        for manager in self.select(job_id):
+            if not manager.active:
+                manager.start_download()
+
+    def stop(self, job_id=None):
+        """停止指定任务，未指定时停止全部任务"""
+        for manager in self.select(job_id):
+            manager.stop_download()
+
+    def set_rate_limit(self, job_id, mbps):
+        """运行时调整单个任务的目标速率（Mbps）"""
+        for manager in self.select(job_id):
+            manager.set_rate_limit(mbps)
+
+    def set_global_rate_limit(self, mbps):
+        """运行时调整全局目标速率（Mbps），0 为不限速"""
+        self.global_limiter.set_rate(max(0, mbps) * 125000)
+
+    def remove_job(self, job_id):
+        self.stop(job_id)
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def select(self, job_id=None):
+        with self.lock:
+            if job_id is None:
+                return list(self.jobs.values())
+            return [self.jobs[job_id]] if job_id in self.jobs else []
+
+    def progress(self):
+        """返回各任务进度及汇总进度"""
+        with self.lock:
+            jobs = dict(self.jobs)
+        per_job = {}
+        for job_id, manager in jobs.items():
+            per_job[job_id] = dict(manager.download_progress, active=manager.active,
+                                   restarts=manager.restart_count, total_downloaded=manager.total_downloaded)
+
+        # 汇总速度按两次统计之间的累计字节差计算，不受各任务周期重置的影响
+        now = time.time()
+        total = sum(progress["total_downloaded"] for progress in per_job.values())
+        last_time, last_total = self.last_sample
+        speed = (total - last_total) / (now - last_time) if now > last_time else 0
+        self.last_sample = (now, total)
+        return {
+            "jobs": per_job,
+            "aggregate": {
+                "active_jobs": sum(1 for progress in per_job.values() if progress["active"]),
+                "speed": max(0, speed),
+                "total_downloaded": total,
+                "connections_in_use": self.connection_budget.in_use,
+                "connection_limit": self.connection_budget.limit
+            }
+        }
+
+    def shutdown(self):
+        """停止全部任务并关闭共享线程池"""
+        self.stop()
+        self.executor.shutdown(wait=False)
+
+
+class DailyQuotaPlanner:
+    """每日流量配额规划器：按 24 小时权重曲线分配每日目标字节数，根据任务的实际累计下载量
+    周期性重新计算目标速率（落后时在当天剩余时段内追赶），达到配额后暂停到次日"""
+
+    # 默认流量曲线（每小时权重）：凌晨最低，白天逐步升高，晚间达到高峰
+    DEFAULT_PROFILE = (3, 2, 1, 1, 1, 1, 2, 3, 4, 5, 5, 5, 5, 5, 5, 5, 5, 6, 7, 8, 8, 7, 6, 4)
+
+    def __init__(self, managers, daily_bytes, hourly_profile=None, interval=10, state_path=None, log=None):
+        if daily_bytes <= 0:
+            raise ValueError("每日流量目标必须大于0")
+        if isinstance(hourly_profile, dict):
+            profile = [hourly_profile.get(hour, 0) for hour in range(24)]
+        else:
+            profile = list(hourly_profile if hourly_profile is not None else self.DEFAULT_PROFILE)
+        if len(profile) != 24 or min(profile) < 0 or sum(profile) <= 0:
+            raise ValueError("流量曲线必须是 24 个非负权重，且不能全为0")
+
+        self.managers = list(managers)
+        self.daily_bytes = daily_bytes
+        self.profile = profile
+        self.interval = interval  # 重新规划间隔（秒）
+        self.state_path = Path(state_path) if state_path else None  # 保存当天进度，进程重启后继续累计
+        self.log = log or (lambda message: None)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.day = None
+        self.done_before = 0  # 本进程接手前当天已完成的字节数（来自状态文件）
+        self.baseline = 0  # 当天开始（或接手）时各任务累计下载量之和
+        self.efficiency = 1.0  # 实际速率 / 限速值（周期间的等待、服务器偏慢等都会使其小于1）
+        self.last_sample = None  # 上次规划时的 (时间, 累计字节, 限速值)
+        self.saved_limits = {}
+        self.saved_holds = {}  # 各任务原来的循环等待（删除）时间
+        self.status = {}
+
+    def total_bytes(self):
+        return sum(manager.total_downloaded for manager in self.managers)
+
+    def done_today(self):
+        return self.done_before + self.total_bytes() - self.baseline
+
+    @staticmethod
+    def is_busy(manager):
+        """任务正在下载，或处于下载完成后的删除等待中（等待也在周期引擎的下载线程中进行）"""
+        return manager.active
+
+    def roll_day(self, local_time):
+        """跨天时重置当天计数；首次运行时从状态文件恢复当天进度"""
+        today = time.strftime("%Y-%m-%d", local_time)
+        if self.day == today:
+            return
+        self.done_before = 0
+        if self.day is None and self.state_path:
+            try:
+                state = json.loads(self.state_path.read_text(encoding="utf-8"))
+                if state.get("day") == today:
+                    self.done_before = int(state.get("done", 0))
+            except (OSError, ValueError):
+                pass
+        elif self.day is not None:
+            self.log(f"\n配额规划: 新的一天 {today}，重新开始计数")
+        self.day = today
+        self.baseline = self.total_bytes()
+        self.efficiency = 1.0
+
+    def save_state(self, done):
+        if not self.state_path:
+            return
+        try:
+            self.state_path.write_text(json.dumps({"day": self.day, "done": done}), encoding="utf-8")
+        except OSError as e:
+            self.log(f"保存配额进度失败: {str(e)}")
+
+    def expected_by(self, local_time):
+        """按流量曲线，当天到此刻应完成的字节数"""
+        hour = local_time.tm_hour
+        elapsed = local_time.tm_min * 60 + local_time.tm_sec
+        weighted = sum(self.profile[:hour]) * 3600 + self.profile[hour] * elapsed
+        return self.daily_bytes * weighted / (sum(self.profile) * 3600)
+
+    def planned_rate(self, local_time, done):
+        """当前小时的目标速率（字节/秒）：剩余配额按当天剩余时段的权重分配"""
+        hour = local_time.tm_hour
+        remaining = self.daily_bytes - done
+        seconds_left = 3600 - (local_time.tm_min * 60 + local_time.tm_sec)
+        weighted_time = self.profile[hour] * seconds_left + sum(self.profile[hour + 1:]) * 3600
+        if remaining <= 0 or self.profile[hour] <= 0 or weighted_time <= 0:
+            return 0
+        return remaining * self.profile[hour] / weighted_time
+
+    @staticmethod
+    def hold_factor(done, expected):
+        """循环节奏：进度落后计划时按落后比例缩短各任务的循环等待时间，把时间留给传输（限速无法弥补带宽上限）"""
+        if expected <= 0 or done >= expected:
+            return 1.0
+        return max(0.0, done / expected)
+
+    def tick(self):
+        """重新规划一次：更新各任务限速，按需要暂停或启动任务"""
+        now = time.time()
+        local_time = time.localtime(now)
+        self.roll_day(local_time)
+        total = self.total_bytes()
+        done = self.done_today()
+        expected = self.expected_by(local_time)
+        rate = self.planned_rate(local_time, done)
+        hold_factor = self.hold_factor(done, expected)
+
+        # 根据上一周期实际达到的速率修正限速值，使平均速率贴近计划
+        if self.last_sample and self.last_sample[2] > 0 and now > self.last_sample[0]:
+            last_time, last_total, last_limit = self.last_sample
+            achieved = (total - last_total) / (now - last_time)
+            self.efficiency = 0.7 * self.efficiency + 0.3 * min(1.0, max(0.1, achieved / last_limit))
+        limit = rate / self.efficiency if rate > 0 else 0
+
+        if limit > 0:
+            state = "running"
+            for manager in self.managers:
+                manager.set_rate_limit(limit / len(self.managers) / 125000)
+                if id(manager) in self.saved_holds:
+                    manager.delete_time = int(self.saved_holds[id(manager)] * hold_factor)
+                if not self.is_busy(manager):
+                    manager.start_download()
+        else:
+            state = "quota_met" if done >= self.daily_bytes else "idle"
+            for manager in self.managers:
+                if self.is_busy(manager):
+                    manager.stop_download()
+
+        previous = self.status
+        self.status = {"day": self.day, "hour": local_time.tm_hour, "state": state, "done": done,
+                       "quota": self.daily_bytes, "expected": expected,
+                       "rate": rate, "limit": limit, "efficiency": self.efficiency, "hold_factor": hold_factor}
+        if previous.get("state") != state or previous.get("hour") != local_time.tm_hour:
+            self.log_status()
+        self.last_sample = (now, total, limit)
+        self.save_state(done)
+
+    def log_status(self):
+        status = self.status
+        format_bytes = DownloadManager.format_bytes
+        if status["state"] == "quota_met":
+            self.log(f"\n配额规划: 今日配额已完成 ({format_bytes(status['done'])})，暂停至次日")
+        elif status["state"] == "idle":
+            self.log(f"\n配额规划: {status['hour']} 点不安排流量，暂停下载")
+        else:
+            self.log(f"\n配额规划: 今日已完成 {format_bytes(status['done'])} / {format_bytes(status['quota'])} "
+                     f"(计划 {format_bytes(status['expected'])})，"
+                     f"{status['hour']} 点目标速率 {format_bytes(status['rate'])}/s"
+                     + (f"，循环等待缩短至 {status['hold_factor']:.0%}" if status['hold_factor'] < 1 else ""))
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                self.log(f"配额规划出错: {str(e)}")
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        """开始按配额调度任务（会接管各任务的限速和循环等待时间）"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.saved_limits = {id(manager): manager.rate_limit_mbps for manager in self.managers}
+        self.saved_holds = {id(manager): manager.delete_time for manager in self.managers}
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, stop_downloads=True):
+        """停止规划，恢复各任务原来的限速和循环等待时间"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        for manager in self.managers:
+            manager.set_rate_limit(self.saved_limits.get(id(manager), 0))
+            manager.delete_time = self.saved_holds.get(id(manager), manager.delete_time)
+            if stop_downloads:
+                manager.stop_download()
+
+
 class DownloadManagerGUI(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -556,6 +3204,7 @@ class DownloadManagerGUI(tk.Tk):
 
         # 创建下载管理器实例
         self.download_manager = DownloadManager(gui_callback=self.gui_callback)
+        self.quota_planner = None  # 每日流量配额规划器（设置了每日流量时创建）
 
         # 设置UI
         self.create_widgets()
@@ -575,6 +3224,7 @@ class DownloadManagerGUI(tk.Tk):
         ttk.Label(url_frame, text="下载链接:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=5)
         self.url_entry = ttk.Entry(url_frame, width=60)
         self.url_entry.grid(row=0, column=1, sticky=tk.EW, padx=5, pady=5)
+        ttk.Label(url_frame, text="多个镜像用空格或分号分隔").grid(row=0, column=2, sticky=tk.W, padx=5, pady=5)
 
         # 下载路径部分
         ttk.Label(url_frame, text="下载路径:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=5)
@@ -591,14 +3241,14 @@ class DownloadManagerGUI(tk.Tk):
         self.delete_time_entry = ttk.Entry(url_frame, width=10, textvariable=self.delete_time_var)
         self.delete_time_entry.grid(row=2, column=1, sticky=tk.W, padx=5, pady=5)
         self.delete_time_var.set("0")
-        ttk.Label(url_frame, text="0=不删除, 1-3600秒").grid(row=2, column=2, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(url_frame, text="0=不删除(仅流量模式为立即重启), 1-3600秒").grid(row=2, column=2, sticky=tk.W, padx=5, pady=5)
 
         # 多线程设置部分
         ttk.Label(url_frame, text="下载线程数:").grid(row=3, column=0, sticky=tk.W, padx=5, pady=5)
         self.thread_var = tk.StringVar()
         self.thread_combo = ttk.Combobox(url_frame, width=5, textvariable=self.thread_var)
-        self.thread_combo['values'] = ('1', '2', '4', '8', '16')
-        self.thread_combo.current(2)  # 默认选择4线程
+        self.thread_combo['values'] = ('自动', '1', '2', '4', '8', '16')
+        self.thread_combo.current(3)  # 默认选择4线程
         self.thread_combo.grid(row=3, column=1, sticky=tk.W, padx=5, pady=5)
 
         self.multithread_var = tk.BooleanVar(value=True)
@@ -609,6 +3259,55 @@ class DownloadManagerGUI(tk.Tk):
         )
         self.multithread_cb.grid(row=3, column=2, sticky=tk.W, padx=5, pady=5)
 
+        # 输出模式部分
+        ttk.Label(url_frame, text="输出模式:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=5)
+        self.output_mode_var = tk.StringVar()
+        self.output_mode_combo = ttk.Combobox(url_frame, width=12, textvariable=self.output_mode_var,
+                                              state="readonly")
+        self.output_mode_combo['values'] = ('预分配直写', '分块合并', '仅流量(不落盘)')
+        self.output_mode_combo.current(0)  # 默认预分配直写
+        self.output_mode_combo.grid(row=4, column=1, sticky=tk.W, padx=5, pady=5)
+
+        self.hedge_var = tk.BooleanVar(value=True)
+        self.hedge_cb = ttk.Checkbutton(
+            url_frame,
+            text="尾部慢速分段发起对冲请求",
+            variable=self.hedge_var
+        )
+        self.hedge_cb.grid(row=4, column=2, sticky=tk.W, padx=5, pady=5)
+
+        # 下载引擎部分
+        ttk.Label(url_frame, text="下载引擎:").grid(row=5, column=0, sticky=tk.W, padx=5, pady=5)
+        self.engine_var = tk.StringVar()
+        self.engine_combo = ttk.Combobox(url_frame, width=12, textvariable=self.engine_var, state="readonly")
+        self.engine_combo['values'] = ('线程池', 'asyncio')
+        self.engine_combo.current(0)  # 默认线程池
+        self.engine_combo.grid(row=5, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(url_frame, text="asyncio引擎可使用1-256个连接").grid(row=5, column=2, sticky=tk.W, padx=5, pady=5)
+
+        # 限速部分
+        ttk.Label(url_frame, text="限速(Mbps):").grid(row=6, column=0, sticky=tk.W, padx=5, pady=5)
+        self.rate_limit_var = tk.StringVar(value="0")
+        self.rate_limit_entry = ttk.Entry(url_frame, width=10, textvariable=self.rate_limit_var)
+        self.rate_limit_entry.grid(row=6, column=1, sticky=tk.W, padx=5, pady=5)
+        self.rate_limit_entry.bind("<Return>", lambda event: self.apply_rate_limit())
+        ttk.Label(url_frame, text="0=不限速, 下载中修改后按回车生效").grid(row=6, column=2, sticky=tk.W, padx=5, pady=5)
+
+        # 每日流量配额部分
+        ttk.Label(url_frame, text="每日流量(GB):").grid(row=7, column=0, sticky=tk.W, padx=5, pady=5)
+        self.daily_quota_var = tk.StringVar(value="0")
+        self.daily_quota_entry = ttk.Entry(url_frame, width=10, textvariable=self.daily_quota_var)
+        self.daily_quota_entry.grid(row=7, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(url_frame, text="0=不启用, 启用后按昼夜流量曲线自动限速, 完成后暂停至次日").grid(
+            row=7, column=2, sticky=tk.W, padx=5, pady=5)
+
+        # 本地源地址部分
+        ttk.Label(url_frame, text="源地址/网卡:").grid(row=8, column=0, sticky=tk.W, padx=5, pady=5)
+        self.source_var = tk.StringVar()
+        self.source_entry = ttk.Entry(url_frame, width=50, textvariable=self.source_var)
+        self.source_entry.grid(row=8, column=1, sticky=tk.EW, padx=5, pady=5)
+        ttk.Label(url_frame, text="多个用空格或逗号分隔, 留空使用默认路由").grid(row=8, column=2, sticky=tk.W, padx=5, pady=5)
+
         # 按钮部分
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=10)
@@ -689,8 +3388,10 @@ class DownloadManagerGUI(tk.Tk):
 
     def start_download(self):
         """开始下载任务"""
-        # 获取用户输入
-        self.download_manager.url = self.url_entry.get()
+        # 获取用户输入（第一个地址为主地址，其余为镜像）
+        urls = self.url_entry.get().replace(';', ' ').split()
+        self.download_manager.url = urls[0] if urls else ""
+        self.download_manager.mirrors = urls[1:]
         self.download_manager.download_path = self.path_entry.get()
 
         try:
@@ -702,11 +3403,19 @@ class DownloadManagerGUI(tk.Tk):
             messagebox.showerror("错误", "请输入有效的整数")
             return
 
-        # 获取线程数
+        # 获取下载引擎
+        self.download_manager.engine = 'asyncio' if self.engine_var.get() == 'asyncio' else 'thread'
+        max_threads = 256 if self.download_manager.engine == 'asyncio' else 32
+
+        # 获取线程数（自动时以引擎允许的最大值为上限）
+        self.download_manager.auto_connections = self.thread_var.get() == '自动'
         try:
-            self.download_manager.thread_count = int(self.thread_var.get())
-            if self.download_manager.thread_count < 1 or self.download_manager.thread_count > 32:
-                messagebox.showerror("错误", "线程数必须在1-32之间")
+            if self.download_manager.auto_connections:
+                self.download_manager.thread_count = max_threads
+            else:
+                self.download_manager.thread_count = int(self.thread_var.get())
+            if self.download_manager.thread_count < 1 or self.download_manager.thread_count > max_threads:
+                messagebox.showerror("错误", f"线程数必须在1-{max_threads}之间")
                 return
         except ValueError:
             messagebox.showerror("错误", "请输入有效的线程数")
@@ -714,6 +3423,34 @@ class DownloadManagerGUI(tk.Tk):
 
         # 获取多线程设置
         self.download_manager.use_multithread = self.multithread_var.get()
+        self.download_manager.hedge_ratio = 2.0 if self.hedge_var.get() else 0
+
+        # 获取限速设置
+        if not self.apply_rate_limit():
+            return
+
+        # 获取每日流量配额
+        try:
+            daily_quota_gb = float(self.daily_quota_var.get() or 0)
+            if daily_quota_gb < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("错误", "每日流量必须是不小于0的数字")
+            return
+
+        # 获取本地源地址
+        sources = self.source_var.get().replace(',', ' ').split()
+        try:
+            for source in sources:
+                SourceAddressPool.resolve_source(source)
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        self.download_manager.source_addresses = sources
+
+        # 获取输出模式
+        output_modes = {'预分配直写': 'preallocate', '分块合并': 'parts', '仅流量(不落盘)': 'discard'}
+        self.download_manager.output_mode = output_modes.get(self.output_mode_var.get(), 'preallocate')
 
         # 验证下载路径
         if not os.path.exists(self.download_manager.download_path):
@@ -724,8 +3461,17 @@ class DownloadManagerGUI(tk.Tk):
                 return
 
         # 验证URL
-        if not self.download_manager.validate_url(self.download_manager.url):
-            messagebox.showerror("错误", "无效的URL格式，请使用HTTP/HTTPS链接")
+        for url in [self.download_manager.url] + self.download_manager.mirrors:
+            if not self.download_manager.validate_url(url):
+                messagebox.showerror("错误", "无效的URL格式，请使用HTTP/HTTPS链接")
+                return
+
+        # 启动下载（启用配额时由规划器按计划启动和暂停）；上一个下载线程尚未退出而未能启动时，界面状态保持不变
+        if daily_quota_gb > 0:
+            self.quota_planner = DailyQuotaPlanner([self.download_manager], daily_quota_gb * 1024 ** 3,
+                                                   log=self.download_manager.log_message)
+            self.quota_planner.start()
+        elif not self.download_manager.start_download():
             return
 
         # 更新按钮状态
@@ -734,19 +3480,46 @@ class DownloadManagerGUI(tk.Tk):
         self.unlock_btn.config(state=tk.NORMAL)
 
         # 更新线程状态显示
-        if self.download_manager.use_multithread:
-            self.thread_status_label.config(text=f"多线程模式 ({self.download_manager.thread_count} 线程)")
-        else:
-            self.thread_status_label.config(text="单线程模式")
-
-        # 启动下载
-        self.download_manager.start_download()
+        self.update_thread_status()
 
         # 开始更新进度
         self.update_progress()
 
+    def update_thread_status(self):
+        """显示当前的连接模式；自适应连接数时显示控制器当前选择的连接数"""
+        manager = self.download_manager
+        if manager.auto_connections and manager.concurrency:
+            count = f"自动: {manager.concurrency.limit}"
+        elif manager.auto_connections:
+            count = "自动"
+        else:
+            count = str(manager.thread_count)
+        if manager.use_multithread and manager.engine == 'asyncio':
+            self.thread_status_label.config(text=f"asyncio模式 ({count} 连接)")
+        elif manager.use_multithread:
+            self.thread_status_label.config(text=f"多线程模式 ({count} 线程)")
+        else:
+            self.thread_status_label.config(text="单线程模式")
+
+    def apply_rate_limit(self):
+        """读取限速设置并应用（下载过程中也可调整）"""
+        try:
+            mbps = float(self.rate_limit_var.get() or 0)
+            if mbps < 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("错误", "限速必须是不小于0的数字")
+            return False
+        self.download_manager.set_rate_limit(mbps)
+        if self.download_manager.active:
+            self.log_message(f"限速已调整为: {'不限速' if mbps == 0 else f'{mbps} Mbps'}")
+        return True
+
     def stop_download(self):
         """停止下载任务"""
+        if self.quota_planner:
+            self.quota_planner.stop()
+            self.quota_planner = None
         self.download_manager.stop_download()
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
@@ -808,9 +3581,11 @@ class DownloadManagerGUI(tk.Tk):
         self.downloaded_label.config(text=self.download_manager.format_bytes(progress["downloaded"]))
         self.total_label.config(text=self.download_manager.format_bytes(progress["total"]))
         self.speed_label.config(text=f"{self.download_manager.format_bytes(progress['speed'])}/s")
+        if self.download_manager.auto_connections:
+            self.update_thread_status()
 
-        # 如果下载结束，恢复按钮状态
-        if not self.download_manager.active:
+        # 如果下载结束（且没有配额规划在等待下一时段），恢复按钮状态
+        if not self.download_manager.active and not self.quota_planner:
             self.start_btn.config(state=tk.NORMAL)
             self.stop_btn.config(state=tk.DISABLED)
 
@@ -821,7 +3596,7 @@ class DownloadManagerGUI(tk.Tk):
         """窗口关闭事件处理"""
         if self.download_manager.active:
             if messagebox.askokcancel("退出", "下载任务仍在运行中，确定要退出吗?"):
-                self.download_manager.stop_download()
+                self.stop_download()
                 self.destroy()
         else:
             self.destroy()
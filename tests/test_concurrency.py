@@ -0,0 +1,84 @@
+import unittest
+import importlib.util
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "download3.4.4.py"
+spec = importlib.util.spec_from_file_location("download_manager", SCRIPT)
+dm = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dm)
+
+
+class ConcurrencyControllerTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        self.total = 0
+
+    def run_periods(self, controller, periods, speed):
+        """模拟 periods 个采样周期，speed(连接数) 返回该周期的总速度；返回每个周期后的目标连接数"""
+        limits = []
+        for _ in range(periods):
+            running = controller.limit
+            self.now += controller.interval
+            self.total += speed(running)
+            limits.append(controller.update(self.total, running, self.now))
+        return limits
+
+    def make(self, **kwargs):
+        controller = dm.ConcurrencyController(**kwargs)
+        controller.update(self.total, controller.limit, self.now)  # 建立采样基准
+        return controller
+
+    def test_additive_increase_up_to_cap(self):
+        controller = self.make(initial=2, maximum=6)
+        limits = self.run_periods(controller, 8, lambda running: running * 1000)
+        self.assertEqual(limits, [3, 4, 5, 6, 6, 6, 6, 6])  # 到达上限后总速度仍在上升也不退回
+        self.assertEqual(controller.peak, 6)
+
+    def test_back_off_when_saturated(self):
+        controller = self.make(initial=2, hold=3)
+        # 超过 4 个连接后总速度不再上升
+        limits = self.run_periods(controller, 8, lambda running: min(running, 4) * 1000)
+        self.assertEqual(limits[:4], [3, 4, 5, 4])
+        # 保持期内不再试探，之后再试探一次仍无提升，再次退回
+        self.assertEqual(limits[4:], [4, 4, 5, 4])
+
+    def test_multiplicative_decrease_on_collapse(self):
+        controller = self.make(initial=8, hold=1)
+        self.run_periods(controller, 1, lambda running: 8000)
+        limits = self.run_periods(controller, 1, lambda running: 1000)
+        self.assertEqual(limits, [4])
+        self.assertEqual(controller.decreases, 1)
+
+    def test_congestion_floor_and_cooldown(self):
+        controller = dm.ConcurrencyController(initial=8, minimum=3)
+        controller.congestion("HTTP 503")
+        self.assertEqual(controller.limit, 4)
+        controller.congestion("HTTP 503")  # 冷却期内同一波拥塞不再减半
+        self.assertEqual(controller.limit, 4)
+        controller.cooldown_until = 0
+        controller.congestion("HTTP 503")
+        self.assertEqual(controller.limit, 3)  # 不低于下限
+        controller.cooldown_until = 0
+        controller.congestion("HTTP 503")
+        self.assertEqual(controller.limit, 3)
+        self.assertEqual(controller.decreases, 2)
+
+    def test_tail_does_not_probe(self):
+        controller = self.make(initial=4)
+        # 剩余分段不足以占满连接时只记录速度，不加连接
+        self.now += 1
+        self.assertEqual(controller.update(10 ** 9, 2, self.now), 4)
+
+    def test_retire_excess_connections(self):
+        controller = dm.ConcurrencyController(initial=8)
+        controller.congestion("连接被重置")
+        controller.update(0, 8, self.now)
+        self.assertEqual([controller.retire() for _ in range(5)], [True, True, True, True, False])
+
+    def test_limits_clamped(self):
+        controller = dm.ConcurrencyController(initial=50, minimum=0, maximum=16)
+        self.assertEqual((controller.minimum, controller.limit), (1, 16))
+
+
+if __name__ == "__main__":
+    unittest.main()
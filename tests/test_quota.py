@@ -0,0 +1,145 @@
+import time
+import shutil
+import tempfile
+import unittest
+import importlib.util
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "download3.4.4.py"
+spec = importlib.util.spec_from_file_location("download_manager", SCRIPT)
+dm = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dm)
+
+DAY = 24 * 3600
+
+
+def at(text):
+    return time.strptime(text, "%Y-%m-%d %H:%M:%S")
+
+
+class FakeManager:
+    """只提供规划器用到的接口"""
+
+    def __init__(self, total_downloaded=0, delete_time=0):
+        self.total_downloaded = total_downloaded
+        self.delete_time = delete_time
+        self.rate_limit_mbps = 0
+        self.active = False
+
+    def set_rate_limit(self, mbps):
+        self.rate_limit_mbps = mbps
+
+    def start_download(self):
+        self.active = True
+        return True
+
+    def stop_download(self):
+        self.active = False
+
+
+class PlanTest(unittest.TestCase):
+    def test_expected_by_follows_profile(self):
+        planner = dm.DailyQuotaPlanner([], DAY, [1] * 24)
+        self.assertEqual(planner.expected_by(at("2026-03-01 00:00:00")), 0)
+        self.assertAlmostEqual(planner.expected_by(at("2026-03-01 12:30:00")), 12.5 * 3600)
+
+        # 只在 0 点和 1 点安排流量，1 点的权重是 0 点的 3 倍
+        planner = dm.DailyQuotaPlanner([], 4000, {0: 1, 1: 3})
+        self.assertAlmostEqual(planner.expected_by(at("2026-03-01 00:30:00")), 500)
+        self.assertAlmostEqual(planner.expected_by(at("2026-03-01 01:00:00")), 1000)
+        self.assertAlmostEqual(planner.expected_by(at("2026-03-01 18:00:00")), 4000)
+
+    def test_planned_rate(self):
+        planner = dm.DailyQuotaPlanner([], DAY, [1] * 24)
+        now = at("2026-03-01 12:30:00")
+        # 按计划进行时速率不变，落后时把剩余配额摊到当天剩余时段
+        self.assertAlmostEqual(planner.planned_rate(now, planner.expected_by(now)), 1.0)
+        self.assertAlmostEqual(planner.planned_rate(now, 0), DAY / (11.5 * 3600))
+        self.assertEqual(planner.planned_rate(now, DAY), 0)
+
+    def test_planned_rate_zero_weight_hour(self):
+        planner = dm.DailyQuotaPlanner([], 4000, {0: 1, 1: 3})
+        self.assertEqual(planner.planned_rate(at("2026-03-01 03:00:00"), 0), 0)
+
+    def test_hold_factor(self):
+        self.assertEqual(dm.DailyQuotaPlanner.hold_factor(50, 100), 0.5)
+        self.assertEqual(dm.DailyQuotaPlanner.hold_factor(150, 100), 1.0)
+        self.assertEqual(dm.DailyQuotaPlanner.hold_factor(0, 0), 1.0)
+
+    def test_invalid_profile(self):
+        with self.assertRaises(ValueError):
+            dm.DailyQuotaPlanner([], DAY, [1] * 23)
+        with self.assertRaises(ValueError):
+            dm.DailyQuotaPlanner([], DAY, [0] * 24)
+        with self.assertRaises(ValueError):
+            dm.DailyQuotaPlanner([], 0)
+
+
+class RolloverTest(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = Path(tempfile.mkdtemp(prefix="dm_quota_"))
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def test_rollover_at_midnight(self):
+        manager = FakeManager(total_downloaded=1000)
+        logs = []
+        planner = dm.DailyQuotaPlanner([manager], DAY, log=logs.append)
+        planner.roll_day(at("2026-03-01 23:59:00"))
+        manager.total_downloaded += 500
+        planner.roll_day(at("2026-03-01 23:59:59"))
+        self.assertEqual(planner.done_today(), 500)
+
+        planner.roll_day(at("2026-03-02 00:00:01"))
+        self.assertEqual(planner.day, "2026-03-02")
+        self.assertEqual(planner.done_today(), 0)
+        self.assertTrue(any("新的一天" in line for line in logs))
+        manager.total_downloaded += 200
+        self.assertEqual(planner.done_today(), 200)
+
+    def test_restore_progress_of_same_day_only(self):
+        state_path = self.state_dir / "quota.json"
+        planner = dm.DailyQuotaPlanner([FakeManager()], DAY, state_path=state_path)
+        planner.roll_day(at("2026-03-01 10:00:00"))
+        planner.save_state(3000)
+
+        planner = dm.DailyQuotaPlanner([FakeManager(total_downloaded=800)], DAY, state_path=state_path)
+        planner.roll_day(at("2026-03-01 11:00:00"))
+        self.assertEqual(planner.done_today(), 3000)
+
+        planner = dm.DailyQuotaPlanner([FakeManager()], DAY, state_path=state_path)
+        planner.roll_day(at("2026-03-02 00:10:00"))
+        self.assertEqual(planner.done_today(), 0)
+
+
+class TickTest(unittest.TestCase):
+    def test_quota_met_stops_downloads(self):
+        manager = FakeManager()
+        manager.active = True
+        planner = dm.DailyQuotaPlanner([manager], 1000, [1] * 24)
+        planner.roll_day(time.localtime())
+        manager.total_downloaded = 1000
+        planner.tick()
+        self.assertEqual(planner.status["state"], "quota_met")
+        self.assertFalse(manager.active)
+
+    def test_running_sets_limit_and_restores_on_stop(self):
+        manager = FakeManager(delete_time=60)
+        planner = dm.DailyQuotaPlanner([manager], 10 ** 12, [1] * 24)
+        planner.saved_limits = {id(manager): 0}
+        planner.saved_holds = {id(manager): 60}
+        planner.tick()
+        self.assertEqual(planner.status["state"], "running")
+        self.assertTrue(manager.active)
+        self.assertGreater(manager.rate_limit_mbps, 0)
+        self.assertLessEqual(manager.delete_time, 60)  # 落后计划时缩短循环等待
+
+        planner.stop()
+        self.assertEqual(manager.rate_limit_mbps, 0)
+        self.assertEqual(manager.delete_time, 60)
+        self.assertFalse(manager.active)
+
+
+if __name__ == "__main__":
+    unittest.main()
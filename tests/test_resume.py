@@ -0,0 +1,119 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import http.server
+import socketserver
+import importlib.util
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "download3.4.4.py"
+spec = importlib.util.spec_from_file_location("download_manager", SCRIPT)
+dm = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dm)
+
+DATA = os.urandom(8 * 1024 * 1024)
+
+
+class SlowRangeHandler(http.server.BaseHTTPRequestHandler):
+    """支持 Range 的本地测试服务器，每 64KB 暂停一下，便于在下载中途停止"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body_headers(self, status, start, end):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', '"resume-test"')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(DATA)}')
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.send_body_headers(200, 0, len(DATA) - 1)
+
+    def do_GET(self):
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(DATA) - 1), len(DATA) - 1)
+            self.send_body_headers(206, start, end)
+        else:
+            start, end = 0, len(DATA) - 1
+            self.send_body_headers(200, start, end)
+        view = memoryview(DATA)[start:end + 1]
+        try:
+            for offset in range(0, len(view), 64 * 1024):
+                self.wfile.write(view[offset:offset + 64 * 1024])
+                time.sleep(0.01)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class SegmentSchedulerTest(unittest.TestCase):
+    def test_completed_ranges_with_journal_lists(self):
+        # 续传日志读出的区间是列表，与进行中分段的元组一起合并
+        scheduler = dm.SegmentScheduler(100, 10, 5, [[0, 20]])
+        segment = scheduler.acquire()
+        segment.written = segment.start + 5
+        self.assertEqual(segment.start, 21)
+        self.assertEqual(scheduler.completed_ranges(), [[0, 25]])
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowRangeHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.download_dir = Path(tempfile.mkdtemp(prefix="dm_resume_"))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def make_manager(self):
+        logs = []
+        manager = dm.DownloadManager(gui_callback=lambda event, data: logs.append(data) if event == "log" else True)
+        manager.url = f"http://127.0.0.1:{self.server.server_address[1]}/file.bin"
+        manager.download_path = str(self.download_dir)
+        manager.use_multithread = True
+        manager.thread_count = 4
+        manager.segment_size = 1024 * 1024
+        manager.logs = logs
+        return manager
+
+    def test_stop_and_resume(self):
+        manager = self.make_manager()
+        thread = threading.Thread(target=manager.download_file, daemon=True)
+        thread.start()
+        deadline = time.time() + 10
+        while manager.download_progress["downloaded"] < 2 * 1024 * 1024 and time.time() < deadline:
+            time.sleep(0.02)
+        manager.stop_download()
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue((self.download_dir / "file.bin.journal").exists())
+
+        manager = self.make_manager()
+        manager.download_file()
+        self.assertTrue(any("继续下载剩余部分" in line for line in manager.logs))
+        self.assertFalse(any("未处理的异常" in line for line in manager.logs))
+        self.assertEqual((self.download_dir / "file.bin").read_bytes(), DATA)
+        self.assertFalse((self.download_dir / "file.bin.journal").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import time
+import unittest
+import importlib.util
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "download3.4.4.py"
+spec = importlib.util.spec_from_file_location("download_manager", SCRIPT)
+dm = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dm)
+
+
+class HedgeTest(unittest.TestCase):
+    def make_hedged(self):
+        """一个 100 字节的分段以 1 B/s 下载了 10 字节，而新连接的典型速度是 100 B/s，应当被对冲"""
+        scheduler = dm.SegmentScheduler(100, 100, 60, hedge_ratio=2, hedge_delay=0)
+        primary = scheduler.acquire()
+        scheduler.reserve(primary, 10)
+        primary.written = 10
+        primary.started_at = time.time() - 10
+        scheduler.rates.append(100.0)
+        hedge = scheduler.acquire()
+        return scheduler, primary, hedge
+
+    def test_hedge_slow_segment(self):
+        scheduler, primary, hedge = self.make_hedged()
+        self.assertIs(hedge.primary, primary)
+        self.assertIs(primary.hedge, hedge)
+        self.assertEqual((hedge.start, hedge.end), (10, 99))
+        self.assertEqual(scheduler.hedge_count, 1)
+        # 已有对冲的分段不会再被对冲
+        self.assertIsNone(scheduler.acquire())
+
+    def test_reserve_skips_duplicate_bytes(self):
+        scheduler, primary, hedge = self.make_hedged()
+        self.assertEqual(scheduler.reserve(hedge, 30), (10, 30, 0))
+        # 原连接接着收到的前 30 字节对冲请求已领取，只有后 20 字节需要写入
+        self.assertEqual(scheduler.reserve(primary, 50), (10, 50, 30))
+        self.assertEqual(scheduler.reserve(hedge, 10), (40, 10, 10))
+        self.assertEqual(scheduler.hedge_wasted, 40)
+
+    def test_double_completion(self):
+        scheduler, primary, hedge = self.make_hedged()
+        self.assertIs(scheduler.complete(hedge), primary)  # 对冲先完成，返回落后的原连接
+        self.assertEqual(scheduler.hedge_wins, 1)
+        self.assertTrue(primary.done)
+        self.assertIsNone(primary.hedge)
+        # 落后的一方随后完成或继续写入都被忽略
+        self.assertIsNone(scheduler.complete(primary))
+        self.assertEqual(scheduler.reserve(primary, 10)[1], 0)
+        self.assertEqual(scheduler.hedge_wins, 1)
+
+    def test_detach(self):
+        scheduler, primary, hedge = self.make_hedged()
+        # 对冲请求出错，原连接仍在下载：无需重试，可以再次对冲
+        self.assertTrue(scheduler.detach(hedge))
+        self.assertIsNone(primary.hedge)
+
+        scheduler, primary, hedge = self.make_hedged()
+        # 原连接出错，由对冲请求接手剩余部分
+        self.assertTrue(scheduler.detach(primary))
+        self.assertFalse(primary.active)
+        self.assertFalse(scheduler.detach(hedge))  # 对冲请求也出错时按普通失败重试
+
+    def test_requeue_from_written(self):
+        scheduler, primary, hedge = self.make_hedged()
+        scheduler.requeue(hedge)
+        self.assertEqual(primary.pos, 10)
+        self.assertIs(scheduler.acquire(), primary)
+
+
+class ParkingTest(unittest.TestCase):
+    def test_parked_workers_limited_to_unhedged_segments(self):
+        scheduler = dm.SegmentScheduler(100, 100, 60, hedge_ratio=2)
+        scheduler.acquire()
+        first, second = object(), object()
+        self.assertEqual(scheduler.retry_wait(first), 0.2)
+        # 只有一个未对冲的分段，第二个空闲连接退出
+        self.assertIsNone(scheduler.retry_wait(second))
+        # 续租不占用额外名额
+        self.assertEqual(scheduler.retry_wait(first), 0.2)
+        self.assertEqual(len(scheduler.parked), 1)
+
+    def test_expired_lease_is_returned(self):
+        scheduler = dm.SegmentScheduler(100, 100, 60, hedge_ratio=2)
+        scheduler.acquire()
+        first, second = object(), object()
+        scheduler.retry_wait(first)
+        scheduler.parked[first] = time.time() - 1  # 第一个连接领到分段或退出后不再续租
+        self.assertEqual(scheduler.retry_wait(second), 0.2)
+        self.assertEqual(list(scheduler.parked), [second])
+
+    def test_no_parking_without_hedging(self):
+        scheduler = dm.SegmentScheduler(100, 100, 60)
+        scheduler.acquire()
+        self.assertIsNone(scheduler.retry_wait(object()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import time
+import calendar
+import unittest
+import importlib.util
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "download3.4.4.py"
+spec = importlib.util.spec_from_file_location("download_manager", SCRIPT)
+dm = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dm)
+
+SIGNED_AT = calendar.timegm((2026, 3, 1, 12, 0, 0))
+
+
+class SignedUrlExpiryTest(unittest.TestCase):
+    def test_expires_timestamp(self):
+        url = f"https://cdn.example.com/file.zip?Expires={SIGNED_AT}&Signature=abc&Key-Pair-Id=K1"
+        self.assertEqual(dm.signed_url_expiry(url), SIGNED_AT)
+
+    def test_amz_expires_is_relative_to_date(self):
+        url = ("https://bucket.s3.amazonaws.com/file.zip?X-Amz-Algorithm=AWS4-HMAC-SHA256"
+               "&X-Amz-Date=20260301T120000Z&X-Amz-Expires=3600&X-Amz-Signature=abc")
+        self.assertEqual(dm.signed_url_expiry(url), SIGNED_AT + 3600)
+
+    def test_goog_expires(self):
+        url = "https://storage.googleapis.com/b/file.zip?X-Goog-Date=20260301T120000Z&X-Goog-Expires=600"
+        self.assertEqual(dm.signed_url_expiry(url), SIGNED_AT + 600)
+
+    def test_parameter_names_are_case_insensitive(self):
+        url = "https://bucket.s3.amazonaws.com/file.zip?x-amz-date=20260301T120000Z&x-amz-expires=60"
+        self.assertEqual(dm.signed_url_expiry(url), SIGNED_AT + 60)
+
+    def test_amz_expires_without_date(self):
+        # 只有有效秒数，不知道签名时间，无法计算
+        url = "https://bucket.s3.amazonaws.com/file.zip?X-Amz-Expires=3600&X-Amz-Signature=abc"
+        self.assertIsNone(dm.signed_url_expiry(url))
+
+    def test_azure_sas(self):
+        url = "https://account.blob.core.windows.net/c/file.zip?sv=2022-11-02&se=2026-03-01T12:00:00Z&sig=abc"
+        self.assertEqual(dm.signed_url_expiry(url), SIGNED_AT)
+
+    def test_unsigned_or_malformed(self):
+        self.assertIsNone(dm.signed_url_expiry("https://example.com/file.zip"))
+        self.assertIsNone(dm.signed_url_expiry("https://example.com/file.zip?Expires=tomorrow"))
+        self.assertIsNone(dm.signed_url_expiry("https://example.com/file.zip?X-Amz-Date=bad&X-Amz-Expires=60"))
+
+
+class MetadataFreshTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = dm.DownloadManager()
+        self.manager.metadata_ttl = 300
+        self.manager.expiry_margin = 60
+
+    def test_fresh_within_ttl(self):
+        now = time.time()
+        self.assertTrue(self.manager.metadata_fresh({"fetched_at": now, "expires_at": None}))
+        self.assertFalse(self.manager.metadata_fresh({"fetched_at": now - 301, "expires_at": None}))
+
+    def test_stale_when_signed_url_about_to_expire(self):
+        now = time.time()
+        self.assertTrue(self.manager.metadata_fresh({"fetched_at": now, "expires_at": now + 120}))
+        self.assertFalse(self.manager.metadata_fresh({"fetched_at": now, "expires_at": now + 30}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+import importlib.util
+from pathlib import Path
+from unittest import mock
+
+SCRIPT = Path(__file__).resolve().parent.parent / "download3.4.4.py"
+spec = importlib.util.spec_from_file_location("download_manager", SCRIPT)
+dm = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dm)
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        patcher = mock.patch.object(dm.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unlimited(self):
+        bucket = dm.TokenBucket()
+        self.assertEqual(bucket.reserve(10 ** 9), 0)
+
+    def test_debt_is_repaid_at_rate(self):
+        bucket = dm.TokenBucket(1000)
+        self.assertAlmostEqual(bucket.reserve(500), 0.5)
+        self.assertAlmostEqual(bucket.reserve(500), 1.0)  # 欠账累计
+        self.now += 1.0
+        self.assertAlmostEqual(bucket.reserve(100), 0.1)
+
+    def test_burst_limited_to_capacity(self):
+        bucket = dm.TokenBucket(1000000)
+        self.assertEqual(bucket.capacity, 200000)
+        self.now += 10
+        self.assertEqual(bucket.reserve(200000), 0)
+        self.assertAlmostEqual(bucket.reserve(100000), 0.1)
+
+    def test_minimum_capacity(self):
+        bucket = dm.TokenBucket(1000)
+        self.assertEqual(bucket.capacity, 64 * 1024)
+
+    def test_change_rate(self):
+        bucket = dm.TokenBucket(1000000)
+        self.now += 10
+        bucket.set_rate(100000)
+        self.assertEqual(bucket.tokens, 64 * 1024)  # 降速时积攒的令牌按新容量截断
+        self.assertAlmostEqual(bucket.reserve(64 * 1024 + 50000), 0.5)
+        bucket.set_rate(0)
+        self.assertEqual(bucket.reserve(10 ** 9), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()